@@ -0,0 +1,198 @@
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+
+import pandas as pd
+
+from card_store import ID_COL
+
+# ==========================================
+# EXPORT ANKI (.txt vectorisé, .apkg natif, incrémental)
+# ==========================================
+# Le .txt est construit par paquets avec des opérations de chaînes pandas.
+# Le .apkg est une collection SQLite (schéma Anki 11) zippée ; le GUID de chaque
+# note est dérivé du card_id, donc une réimportation met à jour les notes
+# existantes au lieu de les dupliquer.
+
+EXPORT_CHUNK = 5000
+DECK_NAME = "Radiopaedia"
+TEXT_HEADER = "#separator:Pipe\n#html:true\n#tags column:4\n"
+
+DECK_ID = 1700000000001
+BASIC_MODEL_ID = 1700000000002
+CLOZE_MODEL_ID = 1700000000003
+CLOZE_NUM_RE = re.compile(r"\{\{c(\d+)::")
+HTML_RE = re.compile(r"<[^>]+>")
+
+
+# --- Texte (pipe) ---
+def _tags(df):
+    tags = df['tags'].fillna("").astype(str).str.strip()
+    return tags.where(tags != "", df['article_title'].astype(str).str.replace(' ', '_', regex=False))
+
+
+def text_lines(df):
+    q = df['question'].astype(str).str.replace('|', '/', regex=False)
+    a = df['answer'].astype(str).str.replace('|', '/', regex=False)
+    return q + "|" + a + "|" + df['card_type'].astype(str) + "|" + _tags(df) + "\n"
+
+
+def write_text(df, out, chunk=EXPORT_CHUNK):
+    out.write(TEXT_HEADER)
+    for start in range(0, len(df), chunk):
+        out.write("".join(text_lines(df.iloc[start:start + chunk])))
+
+
+def build_text(df):
+    out = io.StringIO()
+    write_text(df, out)
+    return out.getvalue()
+
+
+# --- Paquet .apkg ---
+def _stable_int(text, bits=52):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) & ((1 << bits) - 1)
+
+
+def note_guid(card_id):
+    return hashlib.sha256(f"radiopaedia:{card_id}".encode("utf-8")).hexdigest()[:16]
+
+
+def _models(now):
+    css = ".card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }"
+    common = {"mod": now, "usn": -1, "sortf": 0, "did": DECK_ID, "css": css, "tags": [], "vers": [],
+              "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage{amssymb,amsmath}\n"
+                          "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+              "latexPost": "\\end{document}", "latexsvg": False}
+
+    def fields(names):
+        return [{"name": n, "ord": i, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+                for i, n in enumerate(names)]
+
+    basic = dict(common, id=BASIC_MODEL_ID, name="Radiopaedia Basic", type=0, flds=fields(["Front", "Back"]),
+                 req=[[0, "any", [0]]],
+                 tmpls=[{"name": "Card 1", "ord": 0, "qfmt": "{{Front}}", "did": None, "bqfmt": "", "bafmt": "",
+                         "afmt": "{{FrontSide}}<hr id=answer>{{Back}}"}])
+    cloze = dict(common, id=CLOZE_MODEL_ID, name="Radiopaedia Cloze", type=1, flds=fields(["Text", "Back Extra"]),
+                 req=[[0, "any", [0]]],
+                 tmpls=[{"name": "Cloze", "ord": 0, "qfmt": "{{cloze:Text}}", "did": None, "bqfmt": "", "bafmt": "",
+                         "afmt": "{{cloze:Text}}<br>{{Back Extra}}"}])
+    return {str(BASIC_MODEL_ID): basic, str(CLOZE_MODEL_ID): cloze}
+
+
+def _decks(now, deck_name):
+    def deck(did, name):
+        return {"id": did, "name": name, "mod": now, "usn": -1, "desc": "", "dyn": 0, "conf": 1, "collapsed": False,
+                "extendNew": 10, "extendRev": 50, "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0],
+                "timeToday": [0, 0]}
+    return {"1": deck(1, "Default"), str(DECK_ID): deck(DECK_ID, deck_name)}
+
+
+_DCONF = {"1": {"id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True, "timer": 0,
+                "replayq": True, "dyn": False,
+                "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500, "order": 1, "perDay": 20},
+                "rev": {"perDay": 200, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1, "maxIvl": 36500},
+                "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 0}}}
+
+_SCHEMA = """
+CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null, tags text not null);
+CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null, lapses integer not null,
+    left integer not null, odue integer not null, odid integer not null, flags integer not null, data text not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+    type integer not null);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+
+def _note_rows(df, now):
+    is_cloze = df['question'].astype(str).str.contains("{{c", regex=False)
+    tags = " " + _tags(df).str.replace(",", " ", regex=False).str.split().str.join(" ") + " "
+    for (cid, q, a, cloze, tag) in zip(df[ID_COL].astype(str), df['question'].astype(str),
+                                       df['answer'].astype(str), is_cloze, tags):
+        nid = _stable_int(f"note:{cid}")
+        sfld = HTML_RE.sub("", q)
+        csum = int(hashlib.sha1(sfld.encode("utf-8")).hexdigest()[:8], 16)
+        note = (nid, note_guid(cid), CLOZE_MODEL_ID if cloze else BASIC_MODEL_ID, now, -1, tag,
+                f"{q}\x1f{a}", sfld, csum, 0, "")
+        ords = sorted({int(n) - 1 for n in CLOZE_NUM_RE.findall(q)}) if cloze else [0]
+        cards = [(_stable_int(f"card:{cid}:{o}"), nid, DECK_ID, o, now, -1, 0, 0, i, 0, 0, 0, 0, 0, 0, 0, 0, "")
+                 for i, o in enumerate(ords or [0])]
+        yield note, cards
+
+
+def write_apkg(df, out, deck_name=DECK_NAME, chunk=EXPORT_CHUNK):
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "collection.anki2")
+        conn = sqlite3.connect(path)
+        conn.executescript(_SCHEMA)
+        conn.execute("INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')", (
+            now, now * 1000, now * 1000, json.dumps({"nextPos": 1, "curDeck": DECK_ID}),
+            json.dumps(_models(now)), json.dumps(_decks(now, deck_name)), json.dumps(_DCONF)))
+        for start in range(0, len(df), chunk):
+            rows = list(_note_rows(df.iloc[start:start + chunk], now))
+            conn.executemany("INSERT OR REPLACE INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", [n for n, _ in rows])
+            conn.executemany("INSERT OR REPLACE INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                             [c for _, cards in rows for c in cards])
+        conn.commit()
+        conn.close()
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+            z.write(path, "collection.anki2")
+            z.writestr("media", "{}")
+
+
+def build_apkg(df, deck_name=DECK_NAME):
+    out = io.BytesIO()
+    write_apkg(df, out, deck_name)
+    return out.getvalue()
+
+
+# --- Exports incrémentaux ---
+class ExportLog:
+    # Empreinte de chaque carte au dernier export : seules les cartes nouvelles ou modifiées sont ré-exportées
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS exported (card_id TEXT PRIMARY KEY, digest TEXT)")
+
+    @staticmethod
+    def digests(df):
+        cols = ['card_type', 'question', 'answer', 'tags', 'article_title']
+        return pd.util.hash_pandas_object(df[cols].astype(str), index=False).astype(str)
+
+    def changed(self, df):
+        with self.lock:
+            known = dict(self.conn.execute("SELECT card_id, digest FROM exported").fetchall())
+        ids = df[ID_COL].astype(str)
+        return df[ids.map(known).ne(self.digests(df))]
+
+    def mark(self, df):
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO exported VALUES (?, ?)",
+                                  zip(df[ID_COL].astype(str), self.digests(df)))
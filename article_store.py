@@ -0,0 +1,201 @@
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+# ==========================================
+# SNAPSHOT LOCAL DES ARTICLES (SQLite)
+# ==========================================
+# Les colonnes légères (titre, statuts, notes...) sont relues à chaque synchro
+# en une seule requête batch_get. Le contenu (lourd) est stocké sur disque et
+# n'est re-téléchargé que lorsque remote_last_mod_date a changé.
+# Un index plein texte FTS5 (titre + contenu) est tenu à jour par triggers,
+# donc incrémentalement au fil des synchros.
+
+KEY_COL = 'rid'
+MOD_COL = 'remote_last_mod_date'
+HEAVY_COLS = ['content']
+FULL_COLUMN_RATIO = 0.5  # au-delà, on relit la colonne entière d'un coup
+MAX_RANGES_PER_CALL = 200
+SEARCH_LIMIT = 500
+
+
+def col_letter(col):
+    return re.sub(r'\d', '', rowcol_to_a1(1, col))
+
+
+def _column_values(value_range):
+    # batch_get en COLUMNS renvoie [[v1, v2, ...]] (ou [] si la colonne est vide)
+    return list(value_range[0]) if value_range else []
+
+
+class ArticleStore:
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.headers = []
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    rid TEXT PRIMARY KEY,
+                    sheet_row INTEGER,
+                    remote_last_mod_date TEXT,
+                    content TEXT,
+                    content_mod_date TEXT
+                )""")
+            self._init_search()
+
+    def _init_search(self):
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(articles)")}
+        if 'title' not in cols:
+            self.conn.execute("ALTER TABLE articles ADD COLUMN title TEXT")
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'articles_fts'").fetchone()
+        # remove_diacritics : "echographie" trouve "échographie" ; prefix : recherche pendant la frappe
+        self.conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                title, content, content='articles', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            );
+            CREATE TRIGGER IF NOT EXISTS articles_fts_ai AFTER INSERT ON articles BEGIN
+                INSERT INTO articles_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_fts_ad AFTER DELETE ON articles BEGIN
+                INSERT INTO articles_fts(articles_fts, rowid, title, content)
+                VALUES ('delete', old.rowid, old.title, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_fts_au AFTER UPDATE OF title, content ON articles
+            WHEN old.title IS NOT new.title OR old.content IS NOT new.content BEGIN
+                INSERT INTO articles_fts(articles_fts, rowid, title, content)
+                VALUES ('delete', old.rowid, old.title, old.content);
+                INSERT INTO articles_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+            END;
+        """)
+        if not exists:
+            self.conn.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+
+    # --- Synchro des colonnes légères ---
+    def sync(self, worksheet):
+        headers = worksheet.row_values(1)
+        self.headers = headers
+        light_cols = [(i + 1, h) for i, h in enumerate(headers) if h and h not in HEAVY_COLS]
+        ranges = [f"{col_letter(c)}2:{col_letter(c)}" for c, _ in light_cols]
+        value_ranges = worksheet.batch_get(ranges, major_dimension='COLUMNS') if ranges else []
+
+        columns = {h: _column_values(vr) for (_, h), vr in zip(light_cols, value_ranges)}
+        n_rows = max((len(v) for v in columns.values()), default=0)
+        df = pd.DataFrame({h: v + [""] * (n_rows - len(v)) for h, v in columns.items()})
+
+        if KEY_COL in df.columns:
+            # rid canonique (même forme que schema.canonical_rid) : clés du cache et de la recherche
+            rids = df[KEY_COL].astype(str).str.strip().tolist()
+            mods = df[MOD_COL].astype(str).tolist() if MOD_COL in df.columns else [""] * n_rows
+            titles = df['title'].astype(str).tolist() if 'title' in df.columns else [""] * n_rows
+            self._update_index(rids, mods, titles)
+        return df
+
+    def _update_index(self, rids, mods, titles):
+        rows = [(rid, i + 2, mod, title) for i, (rid, mod, title) in enumerate(zip(rids, mods, titles)) if rid]
+        with self.lock, self.conn:
+            self.conn.executemany("""
+                INSERT INTO articles (rid, sheet_row, remote_last_mod_date, title) VALUES (?, ?, ?, ?)
+                ON CONFLICT(rid) DO UPDATE SET
+                    sheet_row = excluded.sheet_row,
+                    remote_last_mod_date = excluded.remote_last_mod_date,
+                    title = excluded.title
+            """, rows)
+            known = {r for (r,) in self.conn.execute("SELECT rid FROM articles")}
+            removed = known - {r[0] for r in rows}
+            self.conn.executemany("DELETE FROM articles WHERE rid = ?", [(r,) for r in removed])
+
+    # --- Contenu (chargement paresseux) ---
+    def stale_rows(self, rids=None):
+        query = """
+            SELECT rid, sheet_row FROM articles
+            WHERE (content IS NULL OR content_mod_date IS NOT remote_last_mod_date)
+        """
+        with self.lock:
+            if rids is None:
+                return self.conn.execute(query).fetchall()
+            rids = [str(r) for r in rids]
+            stale = []
+            for start in range(0, len(rids), 500):
+                chunk = rids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                stale += self.conn.execute(f"{query} AND rid IN ({marks})", chunk).fetchall()
+            return stale
+
+    def sync_content(self, worksheet, rids=None):
+        if 'content' not in self.headers:
+            return 0
+        stale = self.stale_rows(rids)
+        if not stale:
+            return 0
+        letter = col_letter(self.headers.index('content') + 1)
+
+        with self.lock:
+            total = self.conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        fetched = {}
+        if len(stale) > FULL_COLUMN_RATIO * total:
+            values = _column_values(worksheet.batch_get([f"{letter}2:{letter}"], major_dimension='COLUMNS')[0])
+            wanted = {row for _, row in stale}
+            fetched = {i + 2: v for i, v in enumerate(values) if i + 2 in wanted}
+        else:
+            for start in range(0, len(stale), MAX_RANGES_PER_CALL):
+                chunk = stale[start:start + MAX_RANGES_PER_CALL]
+                value_ranges = worksheet.batch_get([f"{letter}{row}" for _, row in chunk], major_dimension='COLUMNS')
+                for (_, row), vr in zip(chunk, value_ranges):
+                    vals = _column_values(vr)
+                    fetched[row] = vals[0] if vals else ""
+
+        updates = [(fetched.get(row, ""), rid) for rid, row in stale]
+        with self.lock, self.conn:
+            self.conn.executemany("""
+                UPDATE articles SET content = ?, content_mod_date = remote_last_mod_date WHERE rid = ?
+            """, updates)
+        return len(updates)
+
+    def get_content(self, rid, worksheet=None):
+        rid = str(rid)
+        if worksheet is not None and self.stale_rows([rid]):
+            self.sync_content(worksheet, [rid])
+        with self.lock:
+            row = self.conn.execute("SELECT content FROM articles WHERE rid = ?", (rid,)).fetchone()
+        return row[0] if row and row[0] is not None else ""
+
+    # --- Recherche plein texte ---
+    def content_coverage(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(content), COUNT(*) FROM articles").fetchone()
+
+    def search(self, text, limit=SEARCH_LIMIT, rids=None):
+        # Chaque mot devient un préfixe ("cardi" -> cardiaque, cardiomyopathy) ; le titre pèse plus que le contenu.
+        # rids restreint la recherche à la vue filtrée : la limite s'applique après le filtre, pas avant.
+        words = re.findall(r'\w+', text)
+        if not words:
+            return None
+        query = " ".join(f'"{w}"*' for w in words)
+        with self.lock:
+            if rids is None:
+                rows = self.conn.execute("""
+                    SELECT a.rid FROM articles_fts f JOIN articles a ON a.rowid = f.rowid
+                    WHERE articles_fts MATCH ? ORDER BY bm25(articles_fts, 10.0, 1.0) LIMIT ?
+                """, (query, limit)).fetchall()
+            else:
+                with self.conn:
+                    self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS search_scope (rid TEXT PRIMARY KEY)")
+                    self.conn.execute("DELETE FROM search_scope")
+                    self.conn.executemany("INSERT OR IGNORE INTO search_scope VALUES (?)", ((str(r),) for r in rids))
+                rows = self.conn.execute("""
+                    SELECT a.rid FROM articles_fts f JOIN articles a ON a.rowid = f.rowid
+                    JOIN search_scope s ON s.rid = a.rid
+                    WHERE articles_fts MATCH ? ORDER BY bm25(articles_fts, 10.0, 1.0) LIMIT ?
+                """, (query, limit)).fetchall()
+        return [r[0] for r in rows]
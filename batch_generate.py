@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import google.generativeai as genai
+import gspread
+from google.oauth2.service_account import Credentials
+from gspread.utils import rowcol_to_a1
+
+from article_store import ArticleStore
+from card_generation import MODES, build_prompts, default_model_index, generate_cards_cached, list_generation_models
+from card_store import ID_COL, CardCache, card_row, new_card_id
+from facets import FacetIndex
+from response_cache import ResponseCache, cache_key
+from schema import compact_articles
+from sheet_index import SheetIndex
+from write_queue import QUOTA_STATUS, with_backoff
+
+# ==========================================
+# GÉNÉRATION DE CARTES EN LOT (sans interface)
+# ==========================================
+# Exemple :
+#   python batch_generate.py --system Chest --todo --concurrency 4 --rpm 30
+# Les appels Gemini tournent dans un pool borné avec limitation de débit et
+# réessais ; chaque article traité est noté dans un fichier de reprise, et les
+# cartes sont ajoutées au Sheet par paquets (append_rows).
+
+LOCAL_CACHE_DIR = ".cache"
+
+
+class RateLimiter:
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Checkpoint:
+    # Journal JSONL : {"rid", "status": "generated", "cards"} puis {"rid", "status": "saved"}
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.generated = {}
+        self.saved = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # dernière ligne tronquée par une interruption
+                    if entry['status'] == 'generated':
+                        self.generated[entry['rid']] = entry['cards']
+                    elif entry['status'] == 'saved':
+                        self.saved.add(entry['rid'])
+
+    def record(self, rid, status, cards=None):
+        entry = {'rid': rid, 'status': status}
+        if cards is not None:
+            entry['cards'] = cards
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if status == 'generated':
+            self.generated[rid] = cards
+        else:
+            self.saved.add(rid)
+
+
+def job_key(args, model_name):
+    # Empreinte des paramètres qui changent les cartes produites (--limit exclu : on peut l'augmenter et reprendre)
+    params = {'mode': args.mode, 'instruction': args.instruction, 'model': model_name,
+              'system': sorted(args.system), 'section': sorted(args.section), 'unread': args.unread,
+              'todo': args.todo}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def select_articles(df, args):
+    mask = df['rid'] != ""
+    if args.unread:
+        mask &= ~df['read_status']
+    if args.todo:
+        mask &= ~df['flashcards_made'] & ~df['ignored']
+    if args.system or args.section:
+        keep = FacetIndex(df, ['system', 'section']).select({'system': args.system, 'section': args.section})
+        mask &= df.index.isin(list(keep))
+    selected = df[mask]
+    return selected.head(args.limit) if args.limit else selected
+
+
+def generate_one(model, model_name, cache, limiter, article, context, args):
+    mode = MODES[0 if args.mode == 'cloze' else 1]
+    prompts = build_prompts(context, article['title'], mode, args.instruction, article['content'])
+    key = cache_key(model_name, mode, args.instruction, article['content'], context)
+    for attempt in range(args.retries + 1):
+        try:
+            cards, _ = generate_cards_cached(cache, key, model, prompts, article, args.no_cache, limiter.wait)
+            return cards
+        except Exception:
+            if attempt == args.retries:
+                raise
+            time.sleep(2 ** attempt + random.random())
+
+
+def save_results(results, ws_cards, cards_headers, worksheet, ws_index, checkpoint):
+    cards = [c for _, batch in results for c in batch]
+    if cards:
+        # Ajout non idempotent : seul le 429 est réessayé ; après une erreur serveur, la reprise
+        # (filtre des card_id déjà présents) évite de dupliquer un ajout qui aurait abouti
+        with_backoff(lambda: ws_cards.append_rows([card_row(c, cards_headers) for c in cards]),
+                     retry_status=QUOTA_STATUS)
+    flag_col = ws_index.col('flashcards_made')
+    flags = [{'range': rowcol_to_a1(ws_index.row(rid), flag_col), 'values': [["Oui"]]}
+             for rid, _ in results if checkpoint.generated.get(rid) and flag_col and ws_index.row(rid)]
+    if flags:
+        with_backoff(lambda: worksheet.batch_update(flags))
+    for rid, _ in results:
+        checkpoint.record(rid, 'saved')
+    print(f"💾 {len(cards)} cartes enregistrées pour {len(results)} article(s)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Génère des flashcards pour un lot d'articles.")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"))
+    parser.add_argument("--system", action="append", default=[], help="Filtre Système (répétable)")
+    parser.add_argument("--section", action="append", default=[], help="Filtre Section (répétable)")
+    parser.add_argument("--unread", action="store_true", help="Articles non lus uniquement")
+    parser.add_argument("--todo", action="store_true", help="Ni ignorés ni déjà transformés en cartes")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--mode", choices=["cloze", "basic"], default="cloze")
+    parser.add_argument("--instruction", default="")
+    parser.add_argument("--model", default=None, help="Par défaut : premier modèle 'flash' disponible")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=30, help="Appels Gemini max par minute")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--flush-every", type=int, default=10, help="Articles par append_rows")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Fichier de reprise (défaut : un fichier par jeu de paramètres dans .cache/)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore et remplace le fichier de reprise existant")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore le cache local des réponses")
+    parser.add_argument("--dry-run", action="store_true", help="Affiche la sélection sans rien générer")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.secrets, "rb") as f:
+        secrets = tomllib.load(f)
+    genai.configure(api_key=secrets.get("GEMINI_API_KEY") or os.environ["GEMINI_API_KEY"])
+    model_name = args.model
+    if not model_name:
+        names = list_generation_models()
+        model_name = names[default_model_index(names)]
+
+    # Reprise propre à chaque jeu (format, instruction, modèle, filtres)
+    checkpoint_path = args.checkpoint or os.path.join(LOCAL_CACHE_DIR,
+                                                      f"batch_checkpoint_{job_key(args, model_name)}.jsonl")
+    os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+    if args.fresh and not args.dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    print(f"📝 Reprise : {checkpoint_path} ({len(checkpoint.saved)} article(s) déjà enregistré(s))")
+
+    creds = Credentials.from_service_account_info(secrets["gcp_service_account"],
+                                                  scopes=["https://www.googleapis.com/auth/spreadsheets"])
+    sh = gspread.authorize(creds).open_by_url(secrets["private_sheet_url"])
+    worksheet = sh.get_worksheet(0)
+    store = ArticleStore(os.path.join(LOCAL_CACHE_DIR, "articles.sqlite"))
+    df = compact_articles(store.sync(worksheet))
+    ws_index = SheetIndex(store.headers, df['rid'].tolist())
+
+    selected = select_articles(df, args)
+    todo = selected[~selected['rid'].isin(checkpoint.saved)]
+    print(f"📚 {len(selected)} article(s) sélectionné(s), {len(todo)} restant(s)")
+    if args.dry_run or todo.empty:
+        return
+
+    card_cache = CardCache(ttl=float("inf"))
+    try:
+        df_cards, ws_cards, cards_headers = card_cache.get(sh, raise_errors=True)
+    except Exception as e:
+        sys.exit(f"❌ Onglet 'Cards' illisible : {type(e).__name__}: {e}")
+    known_ids = set(df_cards[ID_COL].astype(str))
+
+    # Reprise : cartes déjà générées mais pas encore enregistrées (sans doublon si l'ajout avait abouti)
+    pending = []
+    for rid in todo['rid']:
+        if rid in checkpoint.generated:
+            pending.append((rid, [c for c in checkpoint.generated[rid] if c[ID_COL] not in known_ids]))
+    to_generate = todo[~todo['rid'].isin(checkpoint.generated)]
+
+    store.sync_content(worksheet, to_generate['rid'].tolist())
+    model = genai.GenerativeModel(model_name)
+    limiter = RateLimiter(args.rpm)
+    cache = ResponseCache(os.path.join(LOCAL_CACHE_DIR, "responses.sqlite"))
+    print(f"🧠 {len(to_generate)} article(s) à générer avec {model_name} ({args.concurrency} en parallèle)")
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {}
+        for article in to_generate.to_dict('records'):
+            article['content'] = store.get_content(article['rid'])
+            context, _ = card_cache.context_for(article['rid'])
+            futures[pool.submit(generate_one, model, model_name, cache, limiter, article, context, args)] = str(article['rid'])
+
+        for fut in as_completed(futures):
+            rid = futures[fut]
+            try:
+                cards = fut.result()
+            except Exception as e:
+                print(f"❌ {rid} : {e}")
+                continue
+            for c in cards:
+                c[ID_COL] = new_card_id()
+            checkpoint.record(rid, 'generated', cards)
+            pending.append((rid, cards))
+            print(f"✅ {rid} : {len(cards)} carte(s)")
+            if len(pending) >= args.flush_every:
+                save_results(pending, ws_cards, cards_headers, worksheet, ws_index, checkpoint)
+                pending = []
+
+    if pending:
+        save_results(pending, ws_cards, cards_headers, worksheet, ws_index, checkpoint)
+
+
+if __name__ == "__main__":
+    main()
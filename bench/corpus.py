@@ -0,0 +1,58 @@
+import numpy as np
+
+# ==========================================
+# CORPUS SYNTHÉTIQUES
+# ==========================================
+# Articles et cartes au format des onglets réels (mêmes en-têtes), générés
+# de façon déterministe à partir d'une graine.
+
+ARTICLE_HEADERS = ['rid', 'title', 'url', 'system', 'section', 'content', 'remote_last_mod_date',
+                   'read_status', 'flashcards_made', 'ignored', 'notes', 'last_access']
+CARD_HEADERS = ['rid', 'article_title', 'system', 'card_type', 'question', 'answer', 'tags', 'card_id']
+
+SIZES = {
+    "small": (1000, 10000),
+    "medium": (10000, 50000),
+    "large": (50000, 200000),
+}
+
+SYSTEMS = ["Chest", "Neuro", "Musculoskeletal", "Cardiac", "Gastrointestinal", "Hepatobiliary", "Urogenital",
+           "Head & Neck", "Breast", "Paediatrics", "Vascular", "Spine", "Oncology", "Haematology", "Obstetrics"]
+SECTIONS = ["Diagnosis", "Signs", "Anatomy", "Classifications", "Approach", "Syndromes", "Gamuts", "Physics"]
+WORDS = ("pneumothorax épanchement pleural consolidation nodule opacity lesion enhancement fracture "
+         "haemorrhage infarct stenosis aneurysm dissection calcification oedema fibrosis abscess cyst "
+         "tumour metastasis lymphoma sarcoma radiograph tomography résonance ultrasound contrast "
+         "artery vein lobe segment cortex medulla ventricle sulcus sign appearance typical rare "
+         "adult child patient presentation treatment prognosis differential diagnosis imaging").split()
+
+
+def _text(rng, n_words):
+    return " ".join(rng.choice(WORDS, size=n_words))
+
+
+def make_articles(n, content_words=250, seed=0):
+    rng = np.random.RandomState(seed)
+    rows = [ARTICLE_HEADERS]
+    for i in range(n):
+        systems = ", ".join(sorted(set(rng.choice(SYSTEMS, size=rng.randint(1, 3)))))
+        paragraphs = "\n\n".join(_text(rng, content_words // 5) + "." for _ in range(5))
+        rows.append([
+            str(10000 + i), f"{_text(rng, 3).title()} {i}", f"https://radiopaedia.org/articles/{10000 + i}",
+            systems, str(rng.choice(SECTIONS)), paragraphs, f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "Oui" if rng.rand() < 0.3 else "", "Oui" if rng.rand() < 0.2 else "",
+            "Oui" if rng.rand() < 0.05 else "", "", "",
+        ])
+    return rows
+
+
+def make_cards(n, articles, seed=1):
+    rng = np.random.RandomState(seed)
+    rows = [CARD_HEADERS]
+    body = articles[1:]
+    for i in range(n):
+        art = body[rng.randint(len(body))]
+        cloze = rng.rand() < 0.6
+        q = f"{{{{c1::{_text(rng, 2)}}}}} shows {{{{c2::{_text(rng, 3)}}}}} {i}" if cloze else f"{_text(rng, 8)} {i}?"
+        rows.append([art[0], art[1], art[3], "Cloze" if cloze else "Basic", q, "" if cloze else _text(rng, 6),
+                     "", f"card{i:07d}"])
+    return rows
@@ -0,0 +1,266 @@
+import re
+import threading
+import time
+from collections import Counter
+
+from google.api_core.exceptions import ResourceExhausted
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+# ==========================================
+# FAUX GSPREAD / GEMINI EN MÉMOIRE
+# ==========================================
+# Reproduit la surface utilisée par l'app (client, classeur, onglet, modèle)
+# avec une latence et un quota configurables. Chaque appel est compté, ce qui
+# permet de mesurer le nombre de requêtes API d'un flux sans réseau.
+
+RANGE_RE = re.compile(r"^(?:.*!)?([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+class _QuotaResponse:
+    status_code = 429
+    text = "Quota exceeded"
+
+    def json(self):
+        return {"error": {"code": 429, "message": "Quota exceeded (fake)", "status": "RESOURCE_EXHAUSTED"}}
+
+
+class ApiMeter:
+    # Compte les appels, simule la latence et lève des 429 au-delà de per_minute appels / minute
+    def __init__(self, latency=0.0, per_minute=None, sleep=False):
+        self.latency = latency
+        self.per_minute = per_minute
+        self.sleep = sleep
+        self.calls = Counter()
+        self.window = []
+        self.lock = threading.Lock()
+
+    def hit(self, name, error=APIError):
+        with self.lock:
+            now = time.time()
+            self.calls[name] += 1
+            if self.per_minute:
+                self.window = [t for t in self.window if now - t < 60]
+                if len(self.window) >= self.per_minute:
+                    self.calls["quota_errors"] += 1
+                    raise error(_QuotaResponse()) if error is APIError else error("Quota exceeded (fake)")
+                self.window.append(now)
+        if self.sleep and self.latency:
+            time.sleep(self.latency)
+
+    def total(self):
+        return sum(v for k, v in self.calls.items() if k != "quota_errors")
+
+    def simulated_seconds(self):
+        return self.total() * self.latency
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.window = []
+
+
+def _col(letters):
+    return a1_to_rowcol(f"{letters}1")[1]
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, title, rows):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.rows = [list(r) for r in rows]
+        self.meter = spreadsheet.meter
+
+    # --- Utilitaires internes ---
+    @property
+    def col_count(self):
+        return max((len(r) for r in self.rows), default=0)
+
+    def _cell(self, r, c):
+        if r - 1 < len(self.rows) and c - 1 < len(self.rows[r - 1]):
+            return self.rows[r - 1][c - 1]
+        return ""
+
+    def _set(self, r, c, value):
+        while len(self.rows) < r:
+            self.rows.append([])
+        row = self.rows[r - 1]
+        while len(row) < c:
+            row.append("")
+        row[c - 1] = "" if value is None else str(value)
+
+    def _bounds(self, a1):
+        m = RANGE_RE.match(a1)
+        c0 = _col(m.group(1))
+        r0 = int(m.group(2) or 1)
+        if m.group(3) is None:
+            return r0, c0, r0, c0
+        c1 = _col(m.group(3))
+        r1 = int(m.group(4)) if m.group(4) else len(self.rows)
+        return r0, c0, r1, c1
+
+    # --- Lecture ---
+    def row_values(self, row):
+        self.meter.hit("row_values")
+        values = list(self.rows[row - 1]) if row - 1 < len(self.rows) else []
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col, value_render_option=None):
+        self.meter.hit("col_values")
+        values = [self._cell(r, col) for r in range(1, len(self.rows) + 1)]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def get_all_values(self):
+        self.meter.hit("get_all_values")
+        width = self.col_count
+        return [list(r) + [""] * (width - len(r)) for r in self.rows]
+
+    def get_all_records(self):
+        self.meter.hit("get_all_records")
+        headers = self.rows[0] if self.rows else []
+        return [dict(zip(headers, list(r) + [""] * (len(headers) - len(r)))) for r in self.rows[1:]]
+
+    def batch_get(self, ranges, major_dimension=None, value_render_option=None):
+        self.meter.hit("batch_get")
+        out = []
+        for a1 in ranges:
+            r0, c0, r1, c1 = self._bounds(a1)
+            if major_dimension == "COLUMNS":
+                block = [[self._cell(r, c) for r in range(r0, r1 + 1)] for c in range(c0, c1 + 1)]
+            else:
+                block = [[self._cell(r, c) for c in range(c0, c1 + 1)] for r in range(r0, r1 + 1)]
+            for line in block:
+                while line and line[-1] == "":
+                    line.pop()
+            while block and not block[-1]:
+                block.pop()
+            out.append(block)
+        return out
+
+    def find(self, query):
+        self.meter.hit("find")
+        for r, row in enumerate(self.rows, 1):
+            for c, v in enumerate(row, 1):
+                if v == query:
+                    return type("Cell", (), {"row": r, "col": c, "value": v})()
+        return None
+
+    # --- Écriture ---
+    def update_cell(self, row, col, value):
+        self.meter.hit("update_cell")
+        self._set(row, col, value)
+
+    def batch_update(self, data, raw=True, value_input_option=None):
+        self.meter.hit("batch_update")
+        for item in data:
+            r0, c0, _, _ = self._bounds(item['range'])
+            for i, line in enumerate(item['values']):
+                for j, v in enumerate(line):
+                    self._set(r0 + i, c0 + j, v)
+
+    def update(self, values, range_name=None):
+        self.meter.hit("update")
+        for i, line in enumerate(values):
+            for j, v in enumerate(line):
+                self._set(1 + i, 1 + j, v)
+
+    def append_rows(self, values, value_input_option=None):
+        self.meter.hit("append_rows")
+        for line in values:
+            self.rows.append(["" if v is None else str(v) for v in line])
+
+    def add_cols(self, n):
+        self.meter.hit("add_cols")
+
+    def clear(self):
+        self.meter.hit("clear")
+        self.rows = []
+
+
+class FakeSpreadsheet:
+    def __init__(self, meter, sheets):
+        self.meter = meter
+        self.id = "fake-spreadsheet"
+        self.sheets = [FakeWorksheet(self, i, title, rows) for i, (title, rows) in enumerate(sheets)]
+
+    def get_worksheet(self, index):
+        self.meter.hit("get_worksheet")
+        return self.sheets[index]
+
+    def worksheet(self, title):
+        self.meter.hit("worksheet")
+        for ws in self.sheets:
+            if ws.title == title:
+                return ws
+        raise WorksheetNotFound(title)
+
+    def batch_update(self, body):
+        # updateCells / deleteDimension / appendCells, appliqués dans l'ordre comme l'API
+        self.meter.hit("spreadsheet_batch_update")
+        for req in body['requests']:
+            kind, spec = next(iter(req.items()))
+            if kind == 'updateCells':
+                ws = self.sheets[spec['range']['sheetId']]
+                r0, c0 = spec['range']['startRowIndex'], spec['range']['startColumnIndex']
+                for i, row in enumerate(spec['rows']):
+                    for j, cell in enumerate(row['values']):
+                        ws._set(r0 + i + 1, c0 + j + 1, next(iter(cell['userEnteredValue'].values())))
+            elif kind == 'deleteDimension':
+                ws = self.sheets[spec['range']['sheetId']]
+                del ws.rows[spec['range']['startIndex']:spec['range']['endIndex']]
+            elif kind == 'appendCells':
+                ws = self.sheets[spec['sheetId']]
+                for row in spec['rows']:
+                    ws.rows.append([next(iter(c['userEnteredValue'].values())) for c in row['values']])
+        return {}
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_url(self, url):
+        self.spreadsheet.meter.hit("open_by_url")
+        return self.spreadsheet
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    # Renvoie des lignes "Q|A|tags" ; stream=True découpe la réponse en morceaux arbitraires
+    def __init__(self, meter, cards_per_call=8, chunk_chars=40, token_delay=0.0):
+        self.meter = meter
+        self.cards_per_call = cards_per_call
+        self.chunk_chars = chunk_chars
+        self.token_delay = token_delay
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def _text(self):
+        with self.lock:
+            self.counter += 1
+            n = self.counter
+        lines = [f"The {{{{c1::finding {n}.{i}}}}} is typical of {{{{c2::condition {i}}}}}||fake"
+                 for i in range(self.cards_per_call)]
+        return "```\n" + "\n".join(lines) + "\n```"
+
+    def generate_content(self, prompt, stream=False):
+        self.meter.hit("generate_content", error=ResourceExhausted)
+        text = self._text()
+        if not stream:
+            return _Response(text)
+
+        def chunks():
+            for i in range(0, len(text), self.chunk_chars):
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                yield _Response(text[i:i + self.chunk_chars])
+        return chunks()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from anki_export import ExportLog, build_apkg, build_text
+from article_store import ArticleStore
+from bench.corpus import SIZES, make_articles, make_cards
+from bench.fakes import ApiMeter, FakeClient, FakeGenerativeModel, FakeSpreadsheet
+from card_generation import MODES, build_prompts, generate_cards
+from card_store import ID_COL, CardCache, apply_card_diff, card_row, diff_cards, new_card_id
+from dedup import flag_duplicates
+from facets import FacetIndex
+from schema import compact_articles, for_editor
+from sheet_index import SheetIndex
+from write_queue import WriteQueue
+
+# ==========================================
+# BENCHMARK HORS-LIGNE
+# ==========================================
+# Depuis la racine du dépôt :
+#   python -m bench.run_bench --size small --size medium --out bench_report.json
+#   python -m bench.run_bench --size small --compare bench_report.json
+# Chaque flux est chronométré avec un faux Google Sheet / Gemini en mémoire ;
+# le rapport JSON donne le temps mesuré, le nombre d'appels API par méthode et
+# le temps API simulé (appels x latence).
+
+SEARCH_QUERIES = ["pneumo", "epanchement", "fracture", "dissection", "lymph", "sulcus sign", "cortex", "aneur",
+                  "child", "contrast"]
+NOISE_FLOOR = 0.01  # secondes : en dessous, les écarts ne sont pas significatifs
+
+
+class Bench:
+    def __init__(self, meter):
+        self.meter = meter
+        self.flows = {}
+
+    def time(self, name, fn, repeat=1):
+        self.meter.reset()
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            for _ in range(repeat):
+                result = fn()
+        except Exception as e:
+            # Quota simulé dépassé (--quota) : le flux est noté en échec, le banc continue
+            error = f"{type(e).__name__}: {e}"
+        seconds = (time.perf_counter() - start) / repeat
+        calls = {k: v / repeat for k, v in self.meter.calls.items()}
+        self.flows[name] = {
+            "seconds": round(seconds, 6),
+            "api_calls": calls,
+            "simulated_api_seconds": round(self.meter.simulated_seconds() / repeat, 6),
+        }
+        if error:
+            self.flows[name]["error"] = error
+        print(f"  {name:<22} {seconds * 1000:10.1f} ms  {sum(calls.values()):6.1f} appel(s) API" +
+              (f"  ❌ {error}" if error else ""))
+        return result
+
+
+def run_size(label, n_articles, n_cards, args, workdir):
+    print(f"▶ {label} : {n_articles} articles, {n_cards} cartes")
+    meter = ApiMeter(latency=args.latency, per_minute=args.quota, sleep=args.sleep)
+    articles = make_articles(n_articles, content_words=args.content_words)
+    cards = make_cards(n_cards, articles)
+    sh = FakeSpreadsheet(meter, [("Articles", articles), ("Cards", cards)])
+    client = FakeClient(sh)
+    bench = Bench(meter)
+
+    # --- Chargement initial ---
+    store_path = os.path.join(workdir, f"{label}_articles.sqlite")
+
+    def initial_load():
+        sheet = client.open_by_url("fake")
+        ws = sheet.get_worksheet(0)
+        store = ArticleStore(store_path)
+        df = compact_articles(store.sync(ws))
+        return ws, store, df, SheetIndex(store.headers, df['rid'].tolist()), FacetIndex(df, ['system', 'section'])
+
+    ws, store, df, ws_index, facets = bench.time("initial_load_cold", initial_load)
+    bench.time("content_sync", lambda: store.sync_content(ws))
+    ws, store, df, ws_index, facets = bench.time("initial_load_warm", initial_load)
+
+    # --- Filtres / recherche ---
+    systems = facets.options('system')[:2]
+
+    def filter_page():
+        mask = ~df['ignored'] & df.index.isin(list(facets.select({'system': systems[:1], 'section': []})))
+        idx = df.index[mask]
+        return for_editor(df.loc[idx[:50], [c for c in df.columns if c != 'rid']])
+
+    bench.time("filter_page", filter_page, repeat=20)
+    bench.time("search", lambda: [store.search(q) for q in SEARCH_QUERIES], repeat=3)
+
+    # --- Édition du tracker (10 lignes x 2 cellules, un seul envoi) ---
+    def tracker_edit():
+        queue = WriteQueue(ws, max_pending=10 ** 6, flush_interval=3600)
+        for rid in df['rid'].head(10):
+            queue.put(ws_index.row(rid), ws_index.col('read_status'), "Oui")
+            queue.put(ws_index.row(rid), ws_index.col('last_access'), "2024-01-01")
+        return queue.flush()
+
+    bench.time("tracker_edit", tracker_edit)
+
+    # --- Cartes : chargement, doublons, validation d'un brouillon ---
+    cache = CardCache(ttl=float("inf"))
+    df_cards, ws_cards, cards_headers = bench.time("cards_load", lambda: cache.get(sh))
+    bench.time("dedup_index_build", lambda: cache.duplicates(wait=True))
+    article = df.iloc[0]
+    drafts = [{'rid': article['rid'], 'article_title': article['title'], 'system': article['system'],
+               'card_type': "Cloze", 'question': f"The {{{{c1::draft finding {i}}}}} is typical", 'answer': "",
+               'tags': "", ID_COL: new_card_id()} for i in range(8)]
+
+    def draft_validation():
+        cache.context_for(article['rid'])
+        flag_duplicates(cache.duplicates(), [c['question'] for c in drafts])
+        ws_cards.append_rows([card_row(c, cards_headers) for c in drafts])
+        cache.append(drafts)
+
+    bench.time("draft_validation", draft_validation)
+
+    # --- Gestionnaire : sauvegarde différentielle sur une vue filtrée ---
+    def manager_save():
+        df_all = cache.get(sh)[0]
+        view = for_editor(df_all[df_all['system'] == df_all['system'].iloc[0]])
+        edited = view.copy()
+        edited.iloc[:20, edited.columns.get_loc('answer')] = "edited"
+        edited = edited.drop(index=edited.index[20:25])
+        edited = pd.concat([edited, pd.DataFrame([{'question': f"New card {i} question"} for i in range(3)])])
+        inserted, updated, deleted = diff_cards(view, edited)
+        apply_card_diff(ws_cards, cards_headers, inserted, updated, deleted)
+        cache.invalidate()
+
+    bench.time("manager_save", manager_save)
+    df_cards = cache.get(sh)[0]
+
+    # --- Exports ---
+    export_log = ExportLog(os.path.join(workdir, f"{label}_exports.sqlite"))
+    bench.time("export_txt", lambda: build_text(df_cards))
+    bench.time("export_apkg", lambda: build_apkg(df_cards))
+    export_log.mark(df_cards)
+    bench.time("export_delta_scan", lambda: export_log.changed(df_cards))
+
+    # --- Génération (faux Gemini) ---
+    model = FakeGenerativeModel(meter)
+
+    def generation():
+        for rid in df['rid'].head(10):
+            row = df[df['rid'] == rid].iloc[0]
+            context, _ = cache.context_for(rid)
+            prompts = build_prompts(context, row['title'], MODES[0], "", store.get_content(rid))
+            generate_cards(model, prompts, row)
+
+    bench.time("generation_10", generation)
+
+    return {"size": label, "articles": n_articles, "cards": n_cards, "flows": bench.flows}
+
+
+def compare(report, previous, tolerance):
+    # Renvoie la liste des flux plus lents que l'ancien rapport au-delà de la tolérance
+    old = {(r["size"], name): f["seconds"] for r in previous["runs"] for name, f in r["flows"].items()}
+    regressions = []
+    for run in report["runs"]:
+        for name, flow in run["flows"].items():
+            before = old.get((run["size"], name))
+            if "error" in flow:
+                regressions.append(f"{run['size']}/{name} : {flow['error']}")
+                continue
+            if before is None or before < NOISE_FLOOR:
+                continue
+            ratio = flow["seconds"] / before
+            if ratio > 1 + tolerance:
+                regressions.append(f"{run['size']}/{name} : {before:.3f}s -> {flow['seconds']:.3f}s (x{ratio:.2f})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hors-ligne des flux principaux de l'app.")
+    parser.add_argument("--size", action="append", choices=sorted(SIZES), help="Taille(s) de corpus (défaut : small)")
+    parser.add_argument("--articles", type=int, help="Nombre d'articles personnalisé")
+    parser.add_argument("--cards", type=int, help="Nombre de cartes personnalisé")
+    parser.add_argument("--content-words", type=int, default=250, help="Mots par article")
+    parser.add_argument("--latency", type=float, default=0.3, help="Latence simulée par appel API (s)")
+    parser.add_argument("--sleep", action="store_true", help="Attendre réellement la latence simulée")
+    parser.add_argument("--quota", type=int, default=None, help="Appels max par minute avant erreurs 429")
+    parser.add_argument("--out", default="bench_report.json")
+    parser.add_argument("--compare", help="Rapport précédent à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ralentissement toléré (0.2 = +20 %%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [(s, *SIZES[s]) for s in (args.size or ["small"])]
+    if args.articles or args.cards:
+        sizes = [("custom", args.articles or SIZES["small"][0], args.cards or SIZES["small"][1])]
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "latency": args.latency,
+        "quota_per_minute": args.quota,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, n_articles, n_cards in sizes:
+            report["runs"].append(run_size(label, n_articles, n_cards, args, workdir))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Rapport : {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"⚠️ {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
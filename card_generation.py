@@ -0,0 +1,329 @@
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+
+# ==========================================
+# GÉNÉRATION DE CARTES (prompt + parsing)
+# ==========================================
+# Partagé entre le cockpit Streamlit et le mode batch (batch_generate.py).
+
+SYS_PROMPT = """
+System Prompt: Radiology Anki Architect v3.1
+Role: Create Anki cards.
+CONTEXT AWARENESS: Check 'EXISTING CARDS'. Avoid duplicates. Find new angles.
+FORMAT CLOZE: {{c1::Pathology}} shows {{c2::sign}}. COL 2 (Answer) MUST BE EMPTY.
+FORMAT BASIC: Classic Q&A.
+OUTPUT: Column1|Column2|Column3
+"""
+
+MODES = ["Cloze (Trous)", "Basic"]
+
+# Budget en tokens (estimation ~4 caractères / token, sans appel réseau)
+PROMPT_TOKEN_BUDGET = 12000
+CONTEXT_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4
+MAX_PARALLEL_CHUNKS = 4
+MIN_CHUNK_TOKENS = 200  # en dessous, un morceau est fusionné avec son voisin (un appel Gemini pour un titre seul)
+HEADING_RESERVE = 100  # place gardée pour un titre devant un morceau de long paragraphe
+
+
+def list_generation_models(timeout=None):
+    # Modèles Gemini capables de generateContent, triés comme dans la barre latérale (genai déjà configuré)
+    options = {'timeout': timeout} if timeout else None
+    names = [m.name for m in genai.list_models(request_options=options)
+             if 'generateContent' in m.supported_generation_methods]
+    return sorted(names, reverse=True)
+
+
+def default_model_index(names):
+    for i, name in enumerate(names):
+        if "flash" in name.lower(): return i
+    return 0
+
+
+def cards_context(cards):
+    return "".join(f"Q: {r['question']} | A: {r['answer']}\n" for r in cards)
+
+
+def build_prompt(existing_context_text, title, mode, instruction, content):
+    return f"{SYS_PROMPT}\n\nEXISTING CARDS:\n{existing_context_text}\n\nArticle: {title}\nFormat: {mode}\nInstr: {instruction}\nText:\n{content}"
+
+
+# ==========================================
+# PROMPT SOUS BUDGET (découpage des longs articles)
+# ==========================================
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def trim_context(context_text, max_tokens=CONTEXT_TOKEN_BUDGET):
+    # 1) contexte complet ; 2) questions seules ; 3) questions tronquées et plafonnées
+    if estimate_tokens(context_text) <= max_tokens:
+        return context_text
+    lines = [l.split(" | A: ")[0] for l in context_text.splitlines()]
+    text = "\n".join(lines) + "\n"
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cards = [l[:120] for l in lines if l.startswith("Q: ")]
+    budget = max_tokens * CHARS_PER_TOKEN
+    kept, used = [], 0
+    for l in cards:
+        if used + len(l) + 1 > budget:
+            break
+        kept.append(l)
+        used += len(l) + 1
+    return "\n".join(kept) + f"\n(+{len(cards) - len(kept)} other cards not shown)\n"
+
+
+def _is_heading(paragraph):
+    line = paragraph.strip()
+    return line.startswith("#") or (len(line) < 80 and "\n" not in line and not line.endswith((".", ":", ";")))
+
+
+def chunk_article(content, max_tokens):
+    # Découpe par paragraphes en privilégiant les frontières de section (titres)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(content) <= max_chars:
+        return [content]
+    piece_chars = max(max_chars - HEADING_RESERVE, max_chars // 2)
+    paragraphs = []
+    for para in re.split(r"\n\s*\n", content):
+        while len(para) > piece_chars:
+            # Paragraphe trop long : coupe à la dernière fin de phrase possible
+            cut = para.rfind(". ", 0, piece_chars)
+            cut = cut + 1 if cut > 0 else piece_chars
+            paragraphs.append(para[:cut])
+            para = para[cut:].lstrip()
+        if para.strip():
+            paragraphs.append(para)
+
+    chunks, current = [], []
+    size = 0
+    for para in paragraphs:
+        starts_section = _is_heading(para) and size > max_chars // 2
+        if current and (size + len(para) > max_chars or starts_section):
+            # Les titres en fin de morceau passent au suivant, avec la section qu'ils annoncent
+            tail = []
+            while current and _is_heading(current[-1]):
+                tail.insert(0, current.pop())
+            if current:
+                chunks.append("\n\n".join(current))
+            current, size = tail, sum(len(p) + 2 for p in tail)
+        current.append(para)
+        size += len(para) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return _merge_small_chunks(chunks, max_chars, min(MIN_CHUNK_TOKENS * CHARS_PER_TOKEN, max_chars // 4))
+
+
+def _merge_small_chunks(chunks, max_chars, min_chars):
+    merged = []
+    for chunk in chunks:
+        if merged and min(len(chunk), len(merged[-1])) < min_chars and len(merged[-1]) + len(chunk) + 2 <= max_chars:
+            merged[-1] += "\n\n" + chunk
+        else:
+            merged.append(chunk)
+    return merged
+
+
+def build_prompts(existing_context_text, title, mode, instruction, content, budget=PROMPT_TOKEN_BUDGET):
+    context = trim_context(existing_context_text)
+    fixed = estimate_tokens(build_prompt(context, title, mode, instruction, ""))
+    chunks = chunk_article(content, max(budget - fixed, 500))
+    if len(chunks) == 1:
+        return [build_prompt(context, title, mode, instruction, content)]
+    return [build_prompt(context, f"{title} (part {i + 1}/{len(chunks)})", mode, instruction, chunk)
+            for i, chunk in enumerate(chunks)]
+
+
+def _question_key(card):
+    return " ".join(card['question'].lower().split())
+
+
+def merge_cards(batches):
+    seen, merged = set(), []
+    for batch in batches:
+        for card in batch:
+            key = _question_key(card)
+            if key not in seen:
+                seen.add(key)
+                merged.append(card)
+    return merged
+
+
+def generate_raw(model, prompts, before_call=None):
+    # Les morceaux d'un même article sont générés en parallèle ; réponses brutes dans l'ordre
+    def run(prompt):
+        if before_call:
+            before_call()
+        return model.generate_content(prompt).text
+
+    if len(prompts) == 1:
+        return [run(prompts[0])]
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHUNKS, len(prompts))) as pool:
+        return list(pool.map(run, prompts))
+
+
+def cards_from_raw(texts, article):
+    return merge_cards([parse_cards(t, article) for t in texts])
+
+
+def generate_cards(model, prompts, article, before_call=None):
+    return cards_from_raw(generate_raw(model, prompts, before_call), article)
+
+
+def _for_article(cards, article):
+    return [{**c, "rid": str(article['rid']), "article_title": article['title'], "system": article['system']}
+            for c in cards]
+
+
+def generate_cards_cached(cache, key, model, prompts, article, bypass=False, before_call=None):
+    # Renvoie (cartes, servi_depuis_le_cache) ; cache=None ou bypass=True force l'appel à Gemini
+    hit = None if bypass or cache is None else cache.get(key)
+    if hit is not None:
+        return _for_article(hit[1], article), True
+    raw = generate_raw(model, prompts, before_call)
+    cards = cards_from_raw(raw, article)
+    if cache is not None:
+        cache.put(key, raw, cards)
+    return cards, False
+
+
+def parse_card_line(line, article):
+    # Une ligne "Question|Réponse|Tags" -> carte, ou None si la ligne n'est pas exploitable
+    if '|' not in line:
+        return None
+    p = line.split('|')
+    q = p[0].strip()
+    a = p[1].strip()
+    t = p[2].strip() if len(p) > 2 else ""
+    if len(q) <= 5 or "Question" in q:
+        return None
+    return {
+        "rid": str(article['rid']),
+        "article_title": article['title'],
+        "system": article['system'],
+        "card_type": "Cloze" if "{{" in q else "Basic",
+        "question": q, "answer": a, "tags": t
+    }
+
+
+def parse_cards(text, article):
+    clean = text.replace("```", "").strip()
+    cards = [parse_card_line(l, article) for l in clean.split('\n')]
+    return [c for c in cards if c]
+
+
+# ==========================================
+# GÉNÉRATION EN STREAMING (parsing ligne à ligne)
+# ==========================================
+class CardLineParser:
+    # Reçoit le texte par morceaux arbitraires ; émet une carte dès que sa ligne est complète
+    def __init__(self, article):
+        self.article = article
+        self.buffer = ""
+
+    def _parse(self, line):
+        return parse_card_line(line.replace("```", ""), self.article)
+
+    def feed(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        return [c for c in map(self._parse, lines) if c]
+
+    def close(self):
+        # Dernière ligne sans retour à la ligne final
+        line, self.buffer = self.buffer, ""
+        card = self._parse(line)
+        return [card] if card else []
+
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        # Morceau sans texte (fin de flux, blocage de sécurité)
+        return ""
+
+
+def stream_raw(model, prompt, before_call=None):
+    if before_call:
+        before_call()
+    for chunk in model.generate_content(prompt, stream=True):
+        text = _chunk_text(chunk)
+        if text:
+            yield text
+
+
+class CardStream:
+    # Itérable : chaque pas renvoie les nouvelles cartes (dédoublonnées) dès qu'elles arrivent.
+    # Les morceaux d'un long article sont streamés en parallèle ; après itération,
+    # raw contient les réponses brutes (dans l'ordre des prompts) et cards la liste fusionnée.
+    def __init__(self, model, prompts, article, before_call=None):
+        self.model = model
+        self.prompts = prompts
+        self.article = article
+        self.before_call = before_call
+        self.raw = []
+        self.cards = []
+        self.seen = set()
+
+    def _keep(self, cards):
+        new = []
+        for card in cards:
+            key = _question_key(card)
+            if key not in self.seen:
+                self.seen.add(key)
+                new.append(card)
+        self.cards.extend(new)
+        return new
+
+    def __iter__(self):
+        parsers = [CardLineParser(self.article) for _ in self.prompts]
+        parts = [[] for _ in self.prompts]
+        events = queue.Queue()
+
+        def run(i):
+            try:
+                for text in stream_raw(self.model, self.prompts[i], self.before_call):
+                    events.put((i, text))
+            except Exception as e:
+                events.put((i, e))
+            events.put((i, None))
+
+        pool = ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHUNKS, len(self.prompts)))
+        try:
+            for i in range(len(self.prompts)):
+                pool.submit(run, i)
+            pending = len(self.prompts)
+            while pending:
+                i, item = events.get()
+                if isinstance(item, Exception):
+                    raise item
+                if item is None:
+                    pending -= 1
+                    new = parsers[i].close()
+                else:
+                    parts[i].append(item)
+                    new = parsers[i].feed(item)
+                new = self._keep(new)
+                if new:
+                    yield new
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.raw = ["".join(p) for p in parts]
+
+
+def stream_cards_cached(cache, key, model, prompts, article, bypass=False, before_call=None):
+    # Génère (nouvelles_cartes, servi_depuis_le_cache) au fil du flux ; mis en cache une fois le flux complet
+    hit = None if bypass or cache is None else cache.get(key)
+    if hit is not None:
+        yield _for_article(hit[1], article), True
+        return
+    stream = CardStream(model, prompts, article, before_call)
+    for new in stream:
+        yield new, False
+    if cache is not None:
+        cache.put(key, stream.raw, stream.cards)
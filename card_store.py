@@ -0,0 +1,281 @@
+import random
+import threading
+import time
+import uuid
+
+import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1
+
+from article_store import col_letter
+from dedup import DuplicateIndex
+from perf import unwrap
+from schema import compact_cards
+from sheet_index import SheetIndex
+from write_queue import QUOTA_STATUS, with_backoff
+
+# ==========================================
+# CARTES : IDENTIFIANTS STABLES & SAUVEGARDE DIFFÉRENTIELLE
+# ==========================================
+# Chaque carte porte un card_id stable (colonne ajoutée en fin d'onglet).
+# Le gestionnaire compare la vue éditée au snapshot chargé et n'envoie que
+# les lignes insérées / modifiées / supprimées, en une seule requête batchUpdate.
+
+CARD_COLS = ['rid', 'article_title', 'system', 'card_type', 'question', 'answer', 'tags']
+ID_COL = 'card_id'
+
+
+def new_card_id():
+    return uuid.uuid4().hex[:12]
+
+
+def norm(v):
+    # Valeur comparable : None / NaN -> "", 12.0 -> "12"
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def ensure_card_ids(worksheet, headers, df):
+    # Migration : ajoute la colonne card_id et attribue un id aux cartes qui n'en ont pas (une écriture)
+    updates = []
+    headers = list(headers)
+    if not headers:
+        headers = CARD_COLS + [ID_COL]
+        updates.append({'range': f"A1:{col_letter(len(headers))}1", 'values': [headers]})
+    elif ID_COL not in headers:
+        headers.append(ID_COL)
+        if worksheet.col_count < len(headers):
+            worksheet.add_cols(len(headers) - worksheet.col_count)
+        updates.append({'range': rowcol_to_a1(1, len(headers)), 'values': [[ID_COL]]})
+
+    if ID_COL not in df.columns:
+        df[ID_COL] = ""
+    missing = df[ID_COL].map(norm) == ""
+    if missing.any():
+        df.loc[missing, ID_COL] = [new_card_id() for _ in range(int(missing.sum()))]
+        letter = col_letter(headers.index(ID_COL) + 1)
+        updates.append({'range': f"{letter}2:{letter}{len(df) + 1}", 'values': [[v] for v in df[ID_COL]]})
+
+    if updates:
+        with_backoff(lambda: worksheet.batch_update(updates))
+    return headers, df
+
+
+def fetch_cards(sh):
+    worksheet_cards = sh.worksheet("Cards")
+    values = worksheet_cards.get_all_values()
+    headers = values[0] if values else []
+    df_cards = pd.DataFrame(values[1:], columns=headers)
+    # Identifiant stable par carte (migration au premier chargement)
+    headers, df_cards = ensure_card_ids(worksheet_cards, headers, df_cards)
+    # Assurer les colonnes minimales
+    for c in CARD_COLS:
+        if c not in df_cards.columns: df_cards[c] = ""
+    return compact_cards(df_cards), worksheet_cards, headers
+
+
+class CardCache:
+    # Un seul chargement de l'onglet Cards partagé par tous les appelants :
+    # invalidé explicitement après nos écritures, rafraîchi après ttl secondes
+    # pour récupérer les éditions faites directement dans le Sheet.
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.key = None
+        self.entry = None
+        self.loaded_at = 0.0
+        self.by_rid = {}  # rid -> positions des cartes dans le DataFrame
+        self.contexts = {}  # rid -> (texte de contexte, nb de cartes), construit à la demande
+        self.dup_index = None  # index MinHash, (re)construit en arrière-plan à la demande
+        self.dup_fresh = False  # False après un rechargement : dup_index décrit l'ancien chargement
+        self.dup_thread = None
+        self.dup_pending = []  # cartes ajoutées pendant une reconstruction
+
+    def get(self, sh, force=False, raise_errors=False):
+        # Échec du chargement : onglet vide (app) ou exception d'origine avec raise_errors=True (CLI)
+        with self.lock:
+            fresh = self.entry is not None and self.key == sh.id and time.time() - self.loaded_at < self.ttl
+            if force or not fresh:
+                try:
+                    df, worksheet, headers = fetch_cards(sh)
+                except Exception:
+                    self.entry = None
+                    if raise_errors:
+                        raise
+                    return pd.DataFrame(), None, []
+                # Onglet stocké brut (cache partagé) : chaque appelant l'enveloppe pour sa propre session
+                self.entry = (df, unwrap(worksheet), headers)
+                self.key, self.loaded_at = sh.id, time.time()
+                self._build_index(self.entry[0])
+            return self.entry
+
+    def _build_index(self, df):
+        self.by_rid = {str(k): list(v) for k, v in df.groupby('rid', sort=False).indices.items()}
+        self.contexts = {}
+        self.dup_fresh = False
+
+    def duplicates(self, wait=False):
+        # Index de quasi-doublons du deck, hors du chemin des reruns : la construction part dans un thread
+        # et l'index précédent reste servi en attendant (None avant le premier, la détection est alors sautée).
+        # wait=True attend la fin de la construction (action explicite, benchmark).
+        with self.lock:
+            if self.entry is None:
+                return None
+            if not self.dup_fresh and self.dup_thread is None:
+                df = self.entry[0]
+                self.dup_fresh, self.dup_pending = True, []
+                self.dup_thread = threading.Thread(
+                    target=self._build_duplicates, daemon=True,
+                    args=(df[ID_COL].astype(str).tolist(), df['question'].astype(str).tolist(), self.dup_index))
+                self.dup_thread.start()
+            thread = self.dup_thread
+        if wait and thread is not None:
+            thread.join()
+        with self.lock:
+            return self.dup_index
+
+    def _build_duplicates(self, card_ids, questions, previous):
+        # Signatures réutilisées de l'index précédent pour les questions inchangées
+        try:
+            index = DuplicateIndex.build(card_ids, questions, previous)
+        except Exception:
+            index = None
+        with self.lock:
+            if index is not None:
+                for cid, question in self.dup_pending:
+                    index.add(cid, question)
+                self.dup_index = index
+            else:
+                self.dup_fresh = False  # nouvel essai au prochain appel
+            self.dup_pending = []
+            self.dup_thread = None
+
+    def context_for(self, rid):
+        # Contexte "Q: ... | A: ..." des cartes d'un article, sans parcourir tout le deck
+        rid = str(rid)
+        with self.lock:
+            if self.entry is None:
+                return "", 0
+            if rid not in self.contexts:
+                pos = self.by_rid.get(rid, [])
+                text = ""
+                if pos:
+                    sub = self.entry[0].iloc[pos]
+                    lines = "Q: " + sub['question'].astype(str) + " | A: " + sub['answer'].astype(str)
+                    text = "\n".join(lines) + "\n"
+                self.contexts[rid] = (text, len(pos))
+            return self.contexts[rid]
+
+    def append(self, cards):
+        # Ajout local après append_rows : évite de retélécharger tout l'onglet
+        with self.lock:
+            if self.entry is None or not cards:
+                return
+            df, worksheet, headers = self.entry
+            start = len(df)
+            new = pd.DataFrame(cards).reindex(columns=df.columns, fill_value="")
+            self.entry = (compact_cards(pd.concat([df, new], ignore_index=True)), worksheet, headers)
+            for i, card in enumerate(cards):
+                rid = str(card.get('rid', ""))
+                self.by_rid.setdefault(rid, []).append(start + i)
+                self.contexts.pop(rid, None)
+                entry = (str(card.get(ID_COL, "")), str(card.get('question', "")))
+                if self.dup_index is not None:
+                    self.dup_index.add(*entry)
+                if self.dup_thread is not None:
+                    self.dup_pending.append(entry)
+
+    def invalidate(self):
+        with self.lock:
+            self.entry = None
+
+
+def card_row(card, headers):
+    return [norm(card.get(h)) for h in headers]
+
+
+def diff_cards(before, after, cols=CARD_COLS):
+    # Renvoie (insérées, modifiées {card_id: {colonne: nouvelle valeur}}, supprimées [card_id])
+    before_by_id = {norm(r[ID_COL]): r for r in before.to_dict('records')}
+    inserted, updated, seen = [], {}, set()
+    for r in after.to_dict('records'):
+        cid = norm(r.get(ID_COL))
+        if cid not in before_by_id:
+            if any(norm(r.get(c)) for c in cols):
+                card = {c: norm(r.get(c)) for c in cols}
+                card[ID_COL] = new_card_id()
+                inserted.append(card)
+            continue
+        seen.add(cid)
+        old = before_by_id[cid]
+        changed = {c: norm(r.get(c)) for c in cols if norm(r.get(c)) != norm(old.get(c))}
+        if changed:
+            updated[cid] = changed
+    deleted = [cid for cid in before_by_id if cid not in seen]
+    return inserted, updated, deleted
+
+
+def _row_data(values):
+    return {'values': [{'userEnteredValue': {'stringValue': v}} for v in values]}
+
+
+def _diff_requests(worksheet, headers, index, inserted, updated, deleted):
+    requests = []
+    for cid, changed in updated.items():
+        row = index.row(cid)
+        if row is None:
+            continue
+        # Seules les cellules éditées sont réécrites : les autres colonnes gardent leur valeur du Sheet
+        for col, value in changed.items():
+            if col not in headers:
+                continue
+            c = headers.index(col)
+            requests.append({'updateCells': {
+                'range': {'sheetId': worksheet.id, 'startRowIndex': row - 1, 'endRowIndex': row,
+                          'startColumnIndex': c, 'endColumnIndex': c + 1},
+                'rows': [_row_data([value])],
+                'fields': 'userEnteredValue',
+            }})
+    deleted_rows = sorted({index.row(cid) for cid in deleted} - {None}, reverse=True)
+    for row in deleted_rows:
+        requests.append({'deleteDimension': {
+            'range': {'sheetId': worksheet.id, 'dimension': 'ROWS', 'startIndex': row - 1, 'endIndex': row},
+        }})
+    # Cartes déjà présentes (lot appliqué malgré une erreur serveur) : pas de second ajout
+    appended = [card for card in inserted if index.row(card[ID_COL]) is None]
+    if appended:
+        requests.append({'appendCells': {
+            'sheetId': worksheet.id,
+            'rows': [_row_data(card_row(card, headers)) for card in appended],
+            'fields': 'userEnteredValue',
+        }})
+    return requests, deleted_rows, appended
+
+
+def apply_card_diff(worksheet, headers, inserted, updated, deleted, max_retries=5, backoff=1.0):
+    # Relit uniquement la colonne card_id pour repartir de positions exactes,
+    # puis applique modifications, suppressions (de bas en haut) et ajouts en un seul appel.
+    # Le lot dépend des positions : seul un 429 est réessayé tel quel ; après un 5xx
+    # (lot peut-être appliqué), la colonne card_id est relue et le lot reconstruit.
+    if not (inserted or updated or deleted):
+        return None
+    id_col = headers.index(ID_COL) + 1
+    for attempt in range(max_retries + 1):
+        index = SheetIndex(headers, worksheet.col_values(id_col)[1:])
+        requests, deleted_rows, appended = _diff_requests(worksheet, headers, index, inserted, updated, deleted)
+        if not requests:
+            break
+        try:
+            with_backoff(lambda: worksheet.spreadsheet.batch_update({'requests': requests}),
+                         max_retries, backoff, retry_status=QUOTA_STATUS)
+            break
+        except APIError as e:
+            if e.code < 500 or attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+    index.delete_rows(deleted_rows)
+    index.append([c[ID_COL] for c in appended])
+    return index
@@ -0,0 +1,170 @@
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+# ==========================================
+# DÉTECTION DE QUASI-DOUBLONS (MinHash + LSH)
+# ==========================================
+# Questions normalisées (trous {{c1::...}} retirés, accents et ponctuation
+# supprimés) -> shingles de 4 caractères -> signature MinHash. Les bandes LSH
+# ne comparent que les cartes qui partagent au moins une bande, donc la
+# recherche reste sous-linéaire quand le deck grossit.
+
+NUM_PERM = 64
+BANDS = 16
+SHINGLE = 4
+THRESHOLD = 0.7
+_PRIME = (1 << 61) - 1
+
+_rng = np.random.RandomState(42)
+_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+
+CLOZE_RE = re.compile(r"\{\{c\d+::(.*?)(?:::[^}]*)?\}\}")
+
+
+def normalize_question(text):
+    text = CLOZE_RE.sub(r"\1", str(text))
+    text = text.lower()
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    text = re.sub(r"<[^>]+>", " ", text)
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def indexable(norm):
+    # Question vide ou quasi vide une fois normalisée : aucun shingle significatif, jamais comparée
+    return len(norm) >= SHINGLE
+
+
+def _shingle_hashes(norm):
+    if len(norm) <= SHINGLE:
+        shingles = {norm}
+    else:
+        shingles = {norm[i:i + SHINGLE] for i in range(len(norm) - SHINGLE + 1)}
+    return [zlib.crc32(s.encode("utf-8")) for s in shingles]
+
+
+def _signatures(norms, chunk=1000):
+    # Signatures de plusieurs questions normalisées d'un coup (un seul calcul numpy par paquet)
+    out = []
+    for start in range(0, len(norms), chunk):
+        hashes = [_shingle_hashes(n) for n in norms[start:start + chunk]]
+        flat = np.fromiter((h for hs in hashes for h in hs), dtype=np.uint64)
+        offsets = np.cumsum([0] + [len(hs) for hs in hashes[:-1]])
+        # (a * h + b) mod p pour chaque permutation ; h < 2^32 et a < 2^31 : pas de dépassement
+        values = (np.outer(_A, flat) + _B[:, None]) % _PRIME
+        out.extend(np.minimum.reduceat(values, offsets, axis=1).T)
+    return out
+
+
+class DuplicateIndex:
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self.sigs = {}
+        self.questions = {}
+        self.buckets = {}  # (bande, valeurs) -> [card_id]
+
+    @classmethod
+    def build(cls, card_ids, questions, previous=None, threshold=THRESHOLD):
+        # Reconstruit l'index en réutilisant les signatures d'un index précédent pour les questions inchangées
+        index = cls(threshold)
+        todo = []
+        for cid, q in zip(card_ids, questions):
+            if previous is not None and previous.questions.get(cid) == q and cid in previous.sigs:
+                index._insert(cid, q, previous.sigs[cid])
+            else:
+                todo.append((cid, q))
+        if todo:
+            index.add_many([cid for cid, _ in todo], [q for _, q in todo])
+        return index
+
+    def _bands(self, sig):
+        return [(b, sig[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(BANDS)]
+
+    def _insert(self, card_id, question, sig):
+        self.sigs[card_id] = sig
+        self.questions[card_id] = question
+        for band in self._bands(sig):
+            self.buckets.setdefault(band, []).append(card_id)
+
+    def add(self, card_id, question):
+        self.add_many([card_id], [question])
+
+    def add_many(self, card_ids, questions):
+        entries = [(cid, q, normalize_question(q)) for cid, q in zip(card_ids, questions)]
+        kept = [e for e in entries if indexable(e[2])]
+        for (cid, q, _), sig in zip(kept, _signatures([n for _, _, n in kept])):
+            self._insert(cid, q, sig)
+
+    def _candidates(self, sig):
+        found = set()
+        for band in self._bands(sig):
+            found.update(self.buckets.get(band, ()))
+        return found
+
+    def query(self, question, exclude=None):
+        # [(card_id, similarité estimée)] au-dessus du seuil, du plus proche au plus lointain
+        norm = normalize_question(question)
+        if not indexable(norm):
+            return []
+        sig = _signatures([norm])[0]
+        hits = []
+        for cid in self._candidates(sig):
+            if cid == exclude:
+                continue
+            sim = float(np.mean(self.sigs[cid] == sig))
+            if sim >= self.threshold:
+                hits.append((cid, sim))
+        return sorted(hits, key=lambda h: -h[1])
+
+    def clusters(self, max_bucket=50):
+        # Groupes de quasi-doublons sur tout le deck (union-find sur les paires candidates des buckets)
+        parent = {}
+
+        def find(x):
+            root = x
+            while parent.get(root, root) != root:
+                root = parent[root]
+            parent[x] = root
+            return root
+
+        checked = set()
+        for ids in self.buckets.values():
+            if len(ids) < 2:
+                continue
+            # Bucket très peuplé : on ne compare qu'au premier élément pour rester sous-quadratique
+            pairs = [(a, b) for i, a in enumerate(ids) for b in ids[i + 1:]] if len(ids) <= max_bucket \
+                else [(ids[0], b) for b in ids[1:]]
+            for a, b in pairs:
+                if (a, b) in checked or find(a) == find(b):
+                    continue
+                checked.add((a, b))
+                if np.mean(self.sigs[a] == self.sigs[b]) >= self.threshold:
+                    parent[find(b)] = find(a)
+
+        groups = {}
+        for cid in parent:
+            groups.setdefault(find(cid), []).append(cid)
+        return [sorted(g) for g in groups.values() if len(g) > 1]
+
+
+def flag_duplicates(index, questions):
+    # Pour chaque brouillon : (position, question la plus proche, similarité), dans le deck ou parmi les brouillons
+    local = DuplicateIndex(index.threshold if index is not None else THRESHOLD)
+    flags = []
+    for i, q in enumerate(questions):
+        if not indexable(normalize_question(q)):
+            continue  # ligne vide du brouillon (ou ponctuation seule)
+        hits = index.query(q) if index is not None else []
+        source = index
+        if not hits:
+            hits, source = local.query(q), local
+        if hits:
+            cid, sim = hits[0]
+            flags.append((i, source.questions[cid], sim))
+        local.add(f"draft-{i}", q)
+    return flags
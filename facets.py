@@ -0,0 +1,32 @@
+# ==========================================
+# INDEX DE FACETTES (Système / Section)
+# ==========================================
+# Construit une fois par chargement : tag -> ensemble des index de lignes.
+# Un filtre multi-sélection devient une intersection d'ensembles.
+
+
+class FacetIndex:
+    def __init__(self, df, columns):
+        self.rows = {}
+        for col in columns:
+            if col not in df.columns:
+                self.rows[col] = {}
+                continue
+            tags = df[col].astype(object).fillna("").astype(str).str.split(',').explode().str.strip()
+            tags = tags[tags != ""]
+            self.rows[col] = {tag: set(labels) for tag, labels in tags.groupby(tags).groups.items()}
+
+    def options(self, col):
+        return sorted(self.rows.get(col, {}))
+
+    def count(self, col, tag):
+        return len(self.rows.get(col, {}).get(tag, ()))
+
+    def select(self, selections):
+        # selections = {colonne: [tags]} ; toutes les conditions doivent être vraies
+        keep = None
+        for col, tags in selections.items():
+            for tag in tags:
+                labels = self.rows.get(col, {}).get(tag, set())
+                keep = set(labels) if keep is None else keep & labels
+        return keep
@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# ==========================================
+# INSTRUMENTATION (appels API + blocs de calcul)
+# ==========================================
+# Un enregistreur par session : chaque rerun Streamlit ouvre une "passe"
+# qui collecte les événements (appel Sheets / Gemini ou bloc de calcul chronométré).
+# Seul le compteur de quota (QuotaCounter) est partagé par le processus, les
+# quotas des API étant communs à toutes les sessions.
+# Les clients gspread / genai sont enveloppés par session dans un proxy qui
+# chronomètre chaque méthode publique ; les objets Spreadsheet / Worksheet renvoyés
+# sont enveloppés à leur tour, donc tous les appels qui en dérivent (y compris
+# depuis les threads d'arrière-plan de la session) sont comptés.
+
+HISTORY_RERUNS = 50
+QUOTA_WINDOW = 60.0  # secondes
+QUOTAS_PER_MINUTE = {"sheets": 60, "gemini": 15}
+_WRAP_RESULT_TYPES = ("Spreadsheet", "Worksheet")
+_WRAP_ATTRS = ("spreadsheet",)
+CSV_FIELDS = ["rerun", "started_at", "kind", "service", "name", "seconds", "ok", "at"]
+
+
+class QuotaCounter:
+    # Appels API sur la dernière minute glissante, tous utilisateurs confondus
+    def __init__(self, quotas=None):
+        self.lock = threading.Lock()
+        self.quotas = dict(QUOTAS_PER_MINUTE if quotas is None else quotas)
+        self.api_times = {s: deque() for s in self.quotas}
+
+    def hit(self, service, at):
+        with self.lock:
+            if service in self.api_times:
+                self.api_times[service].append(at)
+
+    def usage(self):
+        # {service: (utilisés, quota)}
+        now = time.time()
+        with self.lock:
+            out = {}
+            for service, times in self.api_times.items():
+                while times and now - times[0] > QUOTA_WINDOW:
+                    times.popleft()
+                out[service] = (len(times), self.quotas[service])
+            return out
+
+
+class PerfRecorder:
+    def __init__(self, quota=None, history=HISTORY_RERUNS):
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=history)
+        self.quota = quota if quota is not None else QuotaCounter()
+        self.current = None
+        self.orphans = []  # événements des threads d'arrière-plan entre deux reruns
+        self.n_reruns = 0
+
+    # --- Passes (un rerun = une passe) ---
+    def start_rerun(self):
+        with self.lock:
+            self._close()
+            self.n_reruns += 1
+            self.current = {"rerun": self.n_reruns, "started_at": time.time(), "seconds": None,
+                            "events": self.orphans}
+            self.orphans = []
+
+    def _close(self):
+        if self.current is None:
+            return
+        run = self.current
+        if run["seconds"] is None:
+            # Rerun interrompu (st.stop / st.rerun) : borné par son dernier événement
+            last = max((e["at"] + e["seconds"] for e in run["events"]), default=run["started_at"])
+            run["seconds"] = last - run["started_at"]
+            run["interrupted"] = True
+        self.history.append(run)
+        self.current = None
+
+    def finish(self):
+        # Fin normale du script : durée totale réelle du rerun
+        with self.lock:
+            if self.current is not None:
+                self.current["seconds"] = time.time() - self.current["started_at"]
+                self._close()
+
+    # --- Événements ---
+    def record(self, kind, service, name, seconds, ok=True, at=None):
+        event = {"kind": kind, "service": service, "name": name, "seconds": seconds, "ok": ok,
+                 "at": at if at is not None else time.time() - seconds}
+        with self.lock:
+            (self.current["events"] if self.current is not None else self.orphans).append(event)
+        if kind == "api":
+            self.quota.hit(service, event["at"])
+
+    @contextmanager
+    def timer(self, name, kind="compute", service="app"):
+        start = time.time()
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(kind, service, name, time.perf_counter() - t0, ok, at=start)
+
+    def wrap(self, target, service):
+        if target is None or isinstance(target, Instrumented):
+            return target
+        return Instrumented(target, self, service)
+
+    # --- Lecture ---
+    def quota_usage(self):
+        return self.quota.usage()
+
+    def runs(self):
+        with self.lock:
+            return list(self.history)
+
+    @staticmethod
+    def breakdown(run):
+        # Agrégat par (type, service, nom) : nb d'appels, temps total, erreurs
+        rows = {}
+        for e in run["events"]:
+            key = (e["kind"], e["service"], e["name"])
+            calls, seconds, errors = rows.get(key, (0, 0.0, 0))
+            rows[key] = (calls + 1, seconds + e["seconds"], errors + (not e["ok"]))
+        return [{"kind": k, "service": s, "name": n, "calls": c, "seconds": round(t, 4), "errors": err}
+                for (k, s, n), (c, t, err) in sorted(rows.items(), key=lambda kv: -kv[1][1])]
+
+    def to_json(self):
+        return json.dumps({"quotas": self.quota.quotas, "runs": self.runs()}, indent=2, default=str)
+
+    def to_csv(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for run in self.runs():
+            for e in run["events"]:
+                writer.writerow(dict(e, rerun=run["rerun"], started_at=run["started_at"]))
+        return out.getvalue()
+
+
+def unwrap(target):
+    # Objet d'origine d'un proxy : ce qui est partagé entre sessions ne doit pas rester attaché à l'une d'elles
+    return target._target if isinstance(target, Instrumented) else target
+
+
+class Instrumented:
+    # Proxy transparent : attributs inchangés, méthodes publiques chronométrées
+    def __init__(self, target, recorder, service):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_recorder", recorder)
+        object.__setattr__(self, "_service", service)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _WRAP_ATTRS:
+            return self._wrap_result(attr)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._recorder.timer(name, kind="api", service=self._service):
+                result = attr(*args, **kwargs)
+            return self._wrap_result(result)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __eq__(self, other):
+        return self._target == getattr(other, "_target", other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"Instrumented({self._target!r})"
+
+    def _wrap_result(self, result):
+        if isinstance(result, Instrumented):
+            return result
+        if type(result).__name__.endswith(_WRAP_RESULT_TYPES):
+            return Instrumented(result, self._recorder, self._service)
+        if isinstance(result, list) and result and type(result[0]).__name__.endswith(_WRAP_RESULT_TYPES):
+            return [Instrumented(r, self._recorder, self._service) for r in result]
+        return result
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+# ==========================================
+# PRÉCHARGEMENT DES ARTICLES SUIVANTS
+# ==========================================
+# Pendant la lecture d'un article, un thread d'arrière-plan prépare les N
+# suivants de la vue filtrée : prepare(rids) une fois pour le lot (ex. contenu
+# en un seul batch_get), puis warm(rid, options) pour chaque article. Chaque
+# nouvelle planification remplace la précédente ; le lot en cours s'arrête
+# dès que l'utilisateur a changé d'article.
+
+PREFETCH_AHEAD = 3
+KEEP_RESULTS = 20
+
+
+class Prefetcher:
+    def __init__(self, warm, prepare=None, keep=KEEP_RESULTS):
+        self.warm = warm
+        self.prepare = prepare
+        self.keep = keep
+
+        self.lock = threading.Lock()
+        self.pending = []
+        self.options = {}
+        self.key = None
+        self.generation = 0
+        self.results = OrderedDict()  # rid -> (clé des options, résultat de warm)
+        self.last_error = None  # dernier échec (ex. quota Gemini), effacé par un lot réussi
+        self.running = False
+
+    def schedule(self, rids, key=None, **options):
+        # key identifie les options (ex. modèle, brouillon spéculatif) : un changement relance le préchauffage
+        with self.lock:
+            self.generation += 1
+            self.options, self.key = options, key
+            self.pending = [r for r in map(str, rids) if r not in self.results or self.results[r][0] != key]
+            if self.pending and not self.running:
+                self.running = True
+                threading.Thread(target=self._run, daemon=True).start()
+
+    def result(self, rid, key=None):
+        with self.lock:
+            entry = self.results.get(str(rid))
+            if entry is None or entry[0] != key:
+                return None
+            self.results.move_to_end(str(rid))
+            return entry[1]
+
+    def _run(self):
+        # Le thread s'arrête dès qu'il n'y a plus rien à préparer ; schedule() le relance au besoin
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.running = False
+                    return
+                batch, self.pending = self.pending, []
+                generation, key, options = self.generation, self.key, self.options
+            try:
+                if self.prepare:
+                    self.prepare(batch)
+                for rid in batch:
+                    with self.lock:
+                        if self.generation != generation:
+                            break
+                    value = self.warm(rid, **options)
+                    with self.lock:
+                        self.results[rid] = (key, value)
+                        self.results.move_to_end(rid)
+                        while len(self.results) > self.keep:
+                            self.results.popitem(last=False)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
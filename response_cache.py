@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# ==========================================
+# CACHE DES RÉPONSES GEMINI (adressé par contenu)
+# ==========================================
+# Clé = hash(modèle, format, instruction, hash du contenu, hash du contexte).
+# On conserve la réponse brute et les cartes parsées ; éviction LRU au-delà
+# de max_bytes.
+
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+
+
+def _sha(text):
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+def cache_key(model_name, mode, instruction, content, context):
+    parts = [model_name, mode, instruction, _sha(content), _sha(context)]
+    return _sha(json.dumps(parts, ensure_ascii=False))
+
+
+class ResponseCache:
+    def __init__(self, path, max_bytes=MAX_CACHE_BYTES):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    raw TEXT,
+                    cards TEXT,
+                    size INTEGER,
+                    last_used REAL
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+
+    def get(self, key):
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT raw, cards FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0]), json.loads(row[1])
+
+    def put(self, key, raw, cards):
+        raw_json = json.dumps(raw, ensure_ascii=False)
+        cards_json = json.dumps(cards, ensure_ascii=False)
+        size = len(raw_json) + len(cards_json)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (key, raw_json, cards_json, size, time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
@@ -0,0 +1,52 @@
+import pandas as pd
+
+from article_store import HEAVY_COLS
+
+# ==========================================
+# SCHÉMA : TYPES COMPACTS DES DATAFRAMES
+# ==========================================
+# Appliqué une fois au chargement : booléens natifs (parse vectorisé),
+# catégories pour les colonnes très répétées, rid canonique en str. Les
+# catégories sont reconverties en object uniquement pour les frames envoyés
+# aux data_editor (taille d'une page / d'une vue).
+
+TRUE_VALUES = ['oui', 'true', '1']
+ARTICLE_FLAGS = ['read_status', 'flashcards_made', 'ignored']
+ARTICLE_CATEGORIES = ['system', 'section']
+CARD_CATEGORIES = ['system', 'card_type', 'article_title']
+
+
+def parse_flags(series):
+    return series.astype(str).str.strip().str.lower().isin(TRUE_VALUES)
+
+
+def canonical_rid(series):
+    return series.astype(str).str.strip()
+
+
+def _categorize(df, columns):
+    for c in columns:
+        if c in df.columns:
+            df[c] = df[c].astype(str).astype('category')
+    return df
+
+
+def compact_articles(df):
+    df = df.drop(columns=[c for c in HEAVY_COLS if c in df.columns])
+    if 'rid' in df.columns:
+        df['rid'] = canonical_rid(df['rid'])
+    for c in ARTICLE_FLAGS:
+        df[c] = parse_flags(df[c]) if c in df.columns else False
+    return _categorize(df, ARTICLE_CATEGORIES)
+
+
+def compact_cards(df):
+    if 'rid' in df.columns:
+        df['rid'] = canonical_rid(df['rid'])
+    return _categorize(df, CARD_CATEGORIES)
+
+
+def for_editor(df):
+    # st.data_editor attend du texte libre, pas des catégories figées
+    cats = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.astype({c: object for c in cats}) if cats else df
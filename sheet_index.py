@@ -0,0 +1,51 @@
+import bisect
+
+# ==========================================
+# INDEX LIGNES / COLONNES D'UN ONGLET
+# ==========================================
+# Remplace worksheet.find() + worksheet.row_values(1) : la correspondance
+# clé -> numéro de ligne et en-tête -> numéro de colonne est construite une fois
+# au chargement, puis tenue à jour localement lors des ajouts / suppressions.
+# Les clés sont canoniques (str sans espaces de bord, comme schema.canonical_rid) :
+# l'index construit depuis les valeurs brutes du Sheet répond aux rid compactés.
+
+
+def _key(k):
+    return str(k).strip()
+
+
+class SheetIndex:
+    def __init__(self, headers, keys, first_row=2):
+        self.headers = list(headers)
+        self.col_of = {h: i + 1 for i, h in enumerate(self.headers) if h}
+        self.row_of = {}
+        for i, k in enumerate(keys):
+            k = _key(k)
+            if k and k not in self.row_of:
+                self.row_of[k] = first_row + i
+        self.next_row = first_row + len(keys)
+
+    def row(self, key):
+        return self.row_of.get(_key(key))
+
+    def col(self, header):
+        return self.col_of.get(header)
+
+    def append(self, keys):
+        for k in keys:
+            k = _key(k)
+            if k and k not in self.row_of:
+                self.row_of[k] = self.next_row
+            self.next_row += 1
+
+    def delete_rows(self, rows):
+        # Les lignes situées sous une ligne supprimée remontent d'un cran
+        rows = sorted(set(rows))
+        if not rows:
+            return
+        removed = set(rows)
+        self.row_of = {
+            k: r - bisect.bisect_left(rows, r)
+            for k, r in self.row_of.items() if r not in removed
+        }
+        self.next_row -= len(rows)
@@ -5,15 +5,54 @@ from google.oauth2.service_account import Credentials
 from datetime import datetime, date
 import streamlit.components.v1 as components
 import google.generativeai as genai
-import re
-import io
+import os
 import time
 
+from anki_export import ExportLog, build_apkg, build_text
+from article_store import ArticleStore
+from card_generation import MODES, build_prompts, cards_context, default_model_index, generate_cards_cached, \
+    list_generation_models, stream_cards_cached
+from dedup import flag_duplicates
+from facets import FacetIndex
+from perf import PerfRecorder, QuotaCounter
+from prefetch import PREFETCH_AHEAD, Prefetcher
+from response_cache import ResponseCache, cache_key
+from schema import compact_articles, for_editor
+from card_store import ID_COL, CardCache, apply_card_diff, card_row, diff_cards, new_card_id
+from sheet_index import SheetIndex
+from write_queue import WriteQueue
+
+LOCAL_CACHE_DIR = ".cache"
+CARDS_TTL_SECONDS = 300
+MODELS_TTL_SECONDS = 6 * 3600
+MODELS_TIMEOUT_SECONDS = 10
+MODELS_RETRY_SECONDS = 60  # après un échec du catalogue, pas de nouvel appel avant ce délai
+PAGE_SIZES = [50, 100, 250, 500]
+# Colonnes jamais envoyées à l'éditeur du tracker (masquées ou lourdes)
+TRACKER_HIDDEN_COLS = ['rid', 'content', 'remote_last_mod_date', 'url', 'section', 'Voir']
+
 # ==========================================
 # 1. CONFIGURATION & STYLE
 # ==========================================
 st.set_page_config(page_title="Radiopaedia Cockpit", page_icon="🩻", layout="wide")
 
+
+@st.cache_resource
+def get_quota_counter():
+    # Quotas Sheets / Gemini communs à toutes les sessions du processus
+    return QuotaCounter()
+
+
+def get_perf():
+    # Instrumentation propre à la session (reruns, appels API, blocs de calcul)
+    if "perf" not in st.session_state:
+        st.session_state.perf = PerfRecorder(get_quota_counter())
+    return st.session_state.perf
+
+
+perf = get_perf()
+perf.start_rerun()
+
 st.markdown("""
     <style>
         .block-container {padding-top: 1rem; padding-bottom: 3rem;}
@@ -44,39 +83,107 @@ def get_google_sheet_client():
         return None
 
 
+@st.cache_resource
+def get_gemini_model(api_key, model_name):
+    # Client configuré une fois par clé / modèle, réutilisé entre les reruns
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+@st.cache_data(ttl=MODELS_TTL_SECONDS, show_spinner=False)
+def get_generation_models(api_key):
+    # Catalogue mis en cache par clé ; une exception n'est jamais mise en cache (nouvel essai au rerun suivant)
+    genai.configure(api_key=api_key)
+    with get_perf().timer("list_models", kind="api", service="gemini"):
+        return list_generation_models(timeout=MODELS_TIMEOUT_SECONDS)
+
+
+def available_models(api_key):
+    # (modèles, erreur) : après un échec, le dernier catalogue valide est servi sans rappeler
+    # Gemini pendant MODELS_RETRY_SECONDS, la latence des reruns ne dépend pas de sa disponibilité
+    last_key, last_models = st.session_state.get("last_models", (None, []))
+    known = last_models if last_key == api_key else []
+    failed = st.session_state.get("models_failed")
+    if failed and failed[0] == api_key and time.time() - failed[1] < MODELS_RETRY_SECONDS:
+        return known, failed[2]
+    try:
+        models = get_generation_models(api_key)
+    except Exception as e:
+        st.session_state.models_failed = (api_key, time.time(), str(e))
+        return known, str(e)
+    st.session_state.models_failed = None
+    st.session_state.last_models = (api_key, models)
+    return models, None
+
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(os.path.join(LOCAL_CACHE_DIR, "responses.sqlite"))
+
+
+@st.cache_resource
+def get_export_log():
+    return ExportLog(os.path.join(LOCAL_CACHE_DIR, "exports.sqlite"))
+
+
+@st.cache_resource
+def get_article_store():
+    # Snapshot disque partagé entre les sessions : évite de retélécharger le contenu à chaque démarrage
+    return ArticleStore(os.path.join(LOCAL_CACHE_DIR, "articles.sqlite"))
+
+
 def load_data(client, sheet_url):
     try:
         sh = client.open_by_url(sheet_url)
         worksheet = sh.get_worksheet(0)
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-        return df, worksheet, sh
+        # Colonnes légères uniquement ; 'content' est chargé à la demande via get_article_store()
+        store = get_article_store()
+        with perf.timer("articles.sync"):
+            df = store.sync(worksheet)
+        rids = df['rid'].tolist() if 'rid' in df.columns else []
+        return df, worksheet, sh, SheetIndex(store.headers, rids)
     except Exception:
-        return None, None, None
+        return None, None, None, None
 
 
-def load_cards_data(sh):
-    try:
-        worksheet_cards = sh.worksheet("Cards")
-        data = worksheet_cards.get_all_records()
-        df_cards = pd.DataFrame(data)
-        # Assurer les colonnes minimales
-        expected_cols = ['rid', 'article_title', 'system', 'card_type', 'question', 'answer', 'tags']
-        if df_cards.empty:
-            df_cards = pd.DataFrame(columns=expected_cols)
-        else:
-            for c in expected_cols:
-                if c not in df_cards.columns: df_cards[c] = ""
-        return df_cards, worksheet_cards
-    except:
-        return pd.DataFrame(), None
+@st.cache_resource
+def get_card_cache():
+    return CardCache(ttl=CARDS_TTL_SECONDS)
+
+
+def load_cards_data(sh, force=False):
+    # Onglet Cards mis en cache (au plus un téléchargement par rerun, invalidé après nos écritures) ;
+    # l'onglet partagé est enveloppé ici pour que ses appels soient comptés dans la session courante
+    df_cards, ws_cards, headers = get_card_cache().get(sh, force=force)
+    return df_cards, perf.wrap(ws_cards, "sheets"), headers
 
 
-def get_unique_tags(df, column_name):
-    if column_name not in df.columns: return []
-    all_text = ",".join(df[column_name].dropna().astype(str).tolist())
-    tags = [t.strip() for t in all_text.split(',') if t.strip()]
-    return sorted(list(set(tags)))
+def saved_cards_context(card_cache, rid):
+    text, n = card_cache.context_for(rid)
+    return ("--- SAVED CARDS ---\n" + text if n else ""), n
+
+
+def make_prefetcher(worksheet, sh, store, card_cache, response_cache):
+    # Ressources résolues ici (thread principal) : le worker n'appelle aucune fonction Streamlit
+    def prepare(rids):
+        if sh is not None:
+            card_cache.get(sh)
+        store.sync_content(worksheet, rids)
+
+    def warm(rid, articles=None, model=None, model_name="", speculate_rid=None):
+        context, _ = saved_cards_context(card_cache, rid)
+        content = store.get_content(rid)
+        article = (articles or {}).get(rid, {'rid': rid, 'title': "", 'system': ""})
+        prompts = build_prompts(context, article['title'], MODES[0], "", content)
+        if model is not None and rid == speculate_rid and content:
+            # Brouillon spéculatif : la réponse part dans le cache, "Générer" la servira sans attendre Gemini
+            generate_cards_cached(response_cache, cache_key(model_name, MODES[0], "", content, context), model,
+                                  prompts, article)
+        return {'context': context, 'content': content, 'prompts': prompts}
+
+    prefetcher = Prefetcher(warm, prepare)
+    prefetcher.worksheet = worksheet
+    return prefetcher
 
 
 # ==========================================
@@ -103,38 +210,51 @@ with st.sidebar:
 
     fetched_models = []
     if st.session_state.api_key:
-        try:
-            genai.configure(api_key=st.session_state.api_key)
-            all_models = genai.list_models()
-            for m in all_models:
-                if 'generateContent' in m.supported_generation_methods:
-                    fetched_models.append(m.name)
-            fetched_models.sort(reverse=True)
-        except:
-            pass
+        fetched_models, models_error = available_models(st.session_state.api_key)
+        if models_error:
+            st.warning(f"Modèles Gemini indisponibles ({models_error}). "
+                       + ("Dernière liste connue affichée, n" if fetched_models else "N")
+                       + f"ouvel essai dans {MODELS_RETRY_SECONDS} s au plus.")
 
     if fetched_models:
-        default_idx = 0
-        for i, name in enumerate(fetched_models):
-            if "flash" in name.lower(): default_idx = i; break
-        st.session_state.selected_model = st.selectbox("Modèle IA", fetched_models, index=default_idx)
+        st.session_state.selected_model = st.selectbox("Modèle IA", fetched_models,
+                                                       index=default_model_index(fetched_models))
+    st.checkbox("⚡ Brouillon spéculatif pour l'article suivant", key="speculative_draft",
+                help="Génère en arrière-plan les cartes de l'article suivant (format par défaut, sans instruction)")
+    prefetch_error = getattr(st.session_state.get("prefetcher"), "last_error", None)
+    if prefetch_error:
+        st.caption(f"⚠️ Préchargement / brouillon spéculatif en échec : {prefetch_error}")
+    if st.session_state.api_key and st.button("🔄 Rafraîchir les modèles"):
+        get_generation_models.clear()
+        st.session_state.models_failed = None
+        st.rerun()
+    n_responses, responses_bytes = get_response_cache().stats()
+    if n_responses and st.button(f"🧹 Vider le cache des réponses ({n_responses}, {responses_bytes / 1e6:.1f} Mo)"):
+        get_response_cache().clear()
+        st.toast("Cache des réponses vidé", icon="🧹")
+        st.rerun()
 
     st.divider()
 
     # Export Anki Global
     if "sh_obj" in st.session_state and st.session_state.sh_obj:
         st.subheader("📤 Export Global")
-        if st.button("Télécharger Tout (.txt)"):
-            df_c, _ = load_cards_data(st.session_state.sh_obj)
-            if not df_c.empty:
-                out = io.StringIO()
-                out.write("#separator:Pipe\n#html:true\n#tags column:4\n")
-                for _, r in df_c.iterrows():
-                    q = str(r['question']).replace('|', '/')
-                    a = str(r['answer']).replace('|', '/')
-                    tag = str(r.get('tags', '')).strip() or str(r['article_title']).replace(' ', '_')
-                    out.write(f"{q}|{a}|{r['card_type']}|{tag}\n")
-                st.download_button("Sauvegarder", data=out.getvalue(), file_name=f"anki_full_{date.today()}.txt")
+        export_fmt = st.radio("Format", [".apkg", ".txt"], horizontal=True)
+        only_changed = st.checkbox("Nouvelles / modifiées depuis le dernier export")
+        if st.button("Préparer l'export"):
+            df_c, _, _ = load_cards_data(st.session_state.sh_obj)
+            if only_changed and not df_c.empty:
+                df_c = get_export_log().changed(df_c)
+            if df_c.empty:
+                st.info("Rien de nouveau à exporter.")
+            else:
+                suffix = "delta" if only_changed else "full"
+                with perf.timer("export.build"):
+                    data = build_apkg(df_c) if export_fmt == ".apkg" else build_text(df_c)
+                # Cartes marquées comme exportées seulement au clic sur le téléchargement
+                st.download_button(f"Sauvegarder ({len(df_c)} cartes)", data=data,
+                                   file_name=f"anki_{suffix}_{date.today()}{export_fmt}",
+                                   on_click=get_export_log().mark, args=(df_c,))
 
 # ==========================================
 # 5. CHARGEMENT INITIAL
@@ -145,26 +265,43 @@ except:
     st.error("URL Sheet manquante.")
     st.stop()
 
-if "client" not in st.session_state: st.session_state.client = get_google_sheet_client()
+# Client partagé, enveloppé par session : les appels sont attribués à la session qui les fait
+if "client" not in st.session_state: st.session_state.client = perf.wrap(get_google_sheet_client(), "sheets")
 
 if "df" not in st.session_state:
-    df_load, worksheet, sh_obj = load_data(st.session_state.client, sheet_url)
+    df_load, worksheet, sh_obj, ws_index = load_data(st.session_state.client, sheet_url)
     if df_load is not None:
-        for c in ['read_status', 'flashcards_made', 'ignored']:
-            if c not in df_load.columns:
-                df_load[c] = False
-            else:
-                df_load[c] = df_load[c].apply(lambda x: True if str(x).lower() in ['oui', 'true', '1'] else False)
+        # Types compacts : booléens natifs, catégories, rid canonique (voir schema.py)
+        with perf.timer("articles.compact"):
+            df_load = compact_articles(df_load)
     st.session_state.df = df_load
     st.session_state.worksheet = worksheet
     st.session_state.sh_obj = sh_obj
+    st.session_state.ws_index = ws_index
+    with perf.timer("facets.build"):
+        st.session_state.facets = FacetIndex(df_load, ['system', 'section']) if df_load is not None else None
 else:
     if st.session_state.worksheet is None:
-        _, st.session_state.worksheet, st.session_state.sh_obj = load_data(st.session_state.client, sheet_url)
+        _, st.session_state.worksheet, st.session_state.sh_obj, st.session_state.ws_index = load_data(
+            st.session_state.client, sheet_url)
 
 df_base = st.session_state.df
 worksheet = st.session_state.worksheet
 sh_obj = st.session_state.sh_obj
+ws_index = st.session_state.ws_index
+facets = st.session_state.facets
+
+# File d'écriture différée : survit aux reruns, envoie les éditions du tracker par lots
+if worksheet is not None and getattr(st.session_state.get("write_queue"), "worksheet", None) is not worksheet:
+    st.session_state.write_queue = WriteQueue(worksheet)
+write_queue = st.session_state.get("write_queue")
+
+# Préchargement des articles suivants de la vue (contenu, contexte, brouillon spéculatif)
+if worksheet is not None and getattr(st.session_state.get("prefetcher"), "worksheet", None) is not worksheet:
+    st.session_state.prefetcher = make_prefetcher(worksheet, sh_obj, get_article_store(), get_card_cache(),
+                                                  get_response_cache())
+prefetcher = st.session_state.get("prefetcher")
+prefetch_key = (st.session_state.selected_model, bool(st.session_state.get("speculative_draft")))
 
 # ==========================================
 # 6. APPLICATION PRINCIPALE (ONGLETS)
@@ -182,52 +319,92 @@ with tab_cockpit:
         with st.expander("🔍 Filtrer la liste des articles", expanded=False):
             c1, c2, c3, c4 = st.columns(4)
             view_mode = c1.radio("Vue", ["📥 À faire", "✅ Fait", "📂 Tout"], horizontal=True)
-            u_sys = get_unique_tags(df_base, 'system')
-            sel_sys = c2.multiselect("Système", u_sys)
-            u_sec = get_unique_tags(df_base, 'section')
-            sel_sec = c3.multiselect("Section", u_sec)
-            s_query = c4.text_input("Recherche", "")
-
-        df_display = df_base.copy()
-        if "Voir" in df_display.columns: df_display.drop(columns=["Voir"], inplace=True)
-        df_display.insert(0, "Voir", False)
+            sel_sys = c2.multiselect("Système", facets.options('system'),
+                                     format_func=lambda t: f"{t} ({facets.count('system', t)})")
+            sel_sec = c3.multiselect("Section", facets.options('section'),
+                                     format_func=lambda t: f"{t} ({facets.count('section', t)})")
+            s_query = c4.text_input("Recherche", "", help="Titre et contenu, préfixes et accents tolérés")
+            n_indexed, n_total = get_article_store().content_coverage()
+            if n_indexed < n_total and c4.button(f"📚 Indexer le contenu ({n_indexed}/{n_total})"):
+                with st.spinner("Téléchargement du contenu..."):
+                    get_article_store().sync_content(worksheet)
+                st.rerun()
+
+        # Filtrage sur les index uniquement (pas de copie du DataFrame complet)
+        with perf.timer("tracker.filter"):
+            view_mask = pd.Series(True, index=df_base.index)
+            if view_mode == "📥 À faire":
+                view_mask &= ~df_base['ignored']
+            elif view_mode == "✅ Fait":
+                view_mask &= df_base['read_status'] & df_base['flashcards_made']
+            if sel_sys or sel_sec:
+                keep = facets.select({'system': sel_sys, 'section': sel_sec})
+                view_mask &= df_base.index.isin(list(keep))
+            view_idx = df_base.index[view_mask.to_numpy()]
 
-        if st.session_state.current_rid:
-            mask = df_display['rid'].astype(str) == str(st.session_state.current_rid)
-            df_display.loc[mask, 'Voir'] = True
-
-        df_display['ignored'] = df_display['ignored'].fillna(False).astype(bool)
-        if view_mode == "📥 À faire":
-            df_display = df_display[~df_display['ignored']]
-        elif view_mode == "✅ Fait":
-            df_display = df_display[(df_display['read_status']) & (df_display['flashcards_made'])]
-
-        if sel_sys:
-            for s in sel_sys: df_display = df_display[
-                df_display['system'].astype(str).str.contains(re.escape(s), case=False, regex=True)]
-        if sel_sec:
-            for s in sel_sec: df_display = df_display[
-                df_display['section'].astype(str).str.contains(re.escape(s), case=False, regex=True)]
         if s_query:
-            df_display = df_display[df_display['title'].str.contains(s_query, case=False, na=False)]
-
-        if len(df_display) > 100: df_display = df_display.head(100)
-
-        edited_df = st.data_editor(
-            df_display, height=250, hide_index=True, use_container_width=True, key="editor",
-            column_config={
-                "rid": None, "content": None, "remote_last_mod_date": None, "url": None,
-                "Voir": st.column_config.CheckboxColumn("👁️", width="small"),
-                "title": st.column_config.TextColumn("Titre", disabled=True),
-                "system": st.column_config.TextColumn("Système", width="small", disabled=True),
-                "section": None,
-                "ignored": st.column_config.CheckboxColumn("⛔", width="small"),
-                "read_status": st.column_config.CheckboxColumn("Lu ?", width="small"),
-                "flashcards_made": st.column_config.CheckboxColumn("Flash ?", width="small"),
-                "notes": st.column_config.TextColumn("Notes", width="medium"),
-                "last_access": st.column_config.TextColumn("Dernier", disabled=True)
-            }
-        )
+            with perf.timer("tracker.search"):
+                # Vue déjà restreinte (mode / facettes) : on cherche dans ces articles seulement
+                scope = df_base.loc[view_idx, 'rid'].tolist() if len(view_idx) < len(df_base) else None
+                hits = get_article_store().search(s_query, rids=scope)
+            if hits is not None:
+                # Résultats classés par pertinence (bm25)
+                rank = df_base.loc[view_idx, 'rid'].map({rid: i for i, rid in enumerate(hits)})
+                view_idx = rank.dropna().sort_values().index
+
+        # --- Pagination ---
+        filter_key = (view_mode, tuple(sel_sys), tuple(sel_sec), s_query)
+        if st.session_state.get("tracker_filter_key") != filter_key:
+            st.session_state.tracker_filter_key = filter_key
+            st.session_state.tracker_page = 1
+        page_size = st.session_state.get("tracker_page_size", PAGE_SIZES[0])
+        n_pages = max(1, -(-len(view_idx) // page_size))
+        page = min(st.session_state.get("tracker_page", 1), n_pages)
+        st.session_state.tracker_page = page
+        page_idx = view_idx[(page - 1) * page_size: page * page_size]
+
+        # Préchauffage des N articles qui suivent l'article ouvert dans la vue courante
+        if prefetcher is not None and st.session_state.current_rid:
+            with perf.timer("prefetch.schedule"):
+                view_rids = df_base.loc[view_idx, 'rid'].tolist()
+                current = str(st.session_state.current_rid)
+                start = view_rids.index(current) + 1 if current in view_rids else 0
+                upcoming = df_base.loc[view_idx[start:start + PREFETCH_AHEAD], ['rid', 'title', 'system']]
+                speculate = prefetch_key[1] and st.session_state.api_key and st.session_state.selected_model
+                prefetcher.schedule(
+                    upcoming['rid'].tolist(), key=prefetch_key,
+                    articles={r['rid']: r for r in upcoming.astype(object).to_dict('records')},
+                    model=perf.wrap(get_gemini_model(st.session_state.api_key, st.session_state.selected_model),
+                                    "gemini") if speculate else None,
+                    model_name=st.session_state.selected_model,
+                    speculate_rid=upcoming['rid'].iloc[0] if speculate and len(upcoming) else None)
+
+        # Seule la page visible est matérialisée
+        shown_cols = [c for c in df_base.columns if c not in TRACKER_HIDDEN_COLS]
+        df_display = for_editor(df_base.loc[page_idx, shown_cols]).copy()
+        df_display.insert(0, "Voir", df_base.loc[page_idx, 'rid'] == str(st.session_state.current_rid))
+
+        with perf.timer("render.tracker"):
+            edited_df = st.data_editor(
+                df_display, height=250, hide_index=True, use_container_width=True, key="editor",
+                column_config={
+                    "rid": None, "content": None, "remote_last_mod_date": None, "url": None,
+                    "Voir": st.column_config.CheckboxColumn("👁️", width="small"),
+                    "title": st.column_config.TextColumn("Titre", disabled=True),
+                    "system": st.column_config.TextColumn("Système", width="small", disabled=True),
+                    "section": None,
+                    "ignored": st.column_config.CheckboxColumn("⛔", width="small"),
+                    "read_status": st.column_config.CheckboxColumn("Lu ?", width="small"),
+                    "flashcards_made": st.column_config.CheckboxColumn("Flash ?", width="small"),
+                    "notes": st.column_config.TextColumn("Notes", width="medium"),
+                    "last_access": st.column_config.TextColumn("Dernier", disabled=True)
+                }
+            )
+
+        c_page, c_size, c_count = st.columns([1, 1, 3])
+        c_page.number_input("Page", min_value=1, max_value=n_pages, key="tracker_page")
+        c_size.selectbox("Par page", PAGE_SIZES, key="tracker_page_size")
+        c_count.caption(f"Articles {(page - 1) * page_size + min(1, len(page_idx))}–{(page - 1) * page_size + len(page_idx)} sur {len(view_idx)}")
 
         changes = st.session_state["editor"]["edited_rows"]
         if changes:
@@ -235,7 +412,7 @@ with tab_cockpit:
             for idx_view, chg in changes.items():
                 if "Voir" in chg and chg["Voir"]:
                     orig_idx = df_display.index[idx_view]
-                    row = df_base.iloc[orig_idx]
+                    row = df_base.loc[orig_idx]
                     st.session_state.current_rid = str(row['rid'])
                     st.session_state.current_url = row['url']
                     need_rerun = True
@@ -244,24 +421,45 @@ with tab_cockpit:
                 if data_chg:
                     try:
                         orig_idx = df_display.index[idx_view]
-                        real_rid = df_base.iloc[orig_idx]['rid']
-                        cell = worksheet.find(str(real_rid))
-                        headers = worksheet.row_values(1)
+                        real_rid = df_base.loc[orig_idx, 'rid']
+                        sheet_row = ws_index.row(real_rid)
+                        if sheet_row is None:
+                            st.error(f"Article « {real_rid} » introuvable dans le Sheet : modification ignorée.")
+                            continue
                         for k, v in data_chg.items():
                             val = "Oui" if v is True else ("" if v is False else v)
-                            if k in headers:
-                                worksheet.update_cell(cell.row, headers.index(k) + 1, val)
+                            if ws_index.col(k):
+                                write_queue.put(sheet_row, ws_index.col(k), val)
                                 st.session_state.df.at[orig_idx, k] = v
-                        worksheet.update_cell(cell.row, headers.index('last_access') + 1, str(datetime.now()))
-                        st.toast("Sauvegardé", icon="✅")
+                        if ws_index.col('last_access'):
+                            write_queue.put(sheet_row, ws_index.col('last_access'), str(datetime.now()))
+                        st.toast("Modification en file d'envoi", icon="⏳")
                         need_rerun = True
                     except:
                         pass
             if need_rerun: st.rerun()
 
+        # Statut de la file d'écriture
+        if write_queue:
+            n_pending = write_queue.pending_count()
+            c_status, c_flush = st.columns([4, 1])
+            if write_queue.failed:
+                c_status.error(f"❌ {len(write_queue.failed)} cellule(s) refusée(s) par le Sheet, non renvoyée(s) :\n" +
+                               "\n".join(f"- ligne {r}, colonne {c} = « {v} » ({err})"
+                                         for r, c, v, err in write_queue.failed[-5:]))
+            if write_queue.last_error:
+                c_status.warning(f"⚠️ {n_pending} modification(s) en attente, nouvel essai prévu ({write_queue.last_error})")
+            elif n_pending:
+                c_status.caption(f"⏳ {n_pending} modification(s) en attente d'envoi")
+            elif write_queue.flushed:
+                c_status.caption(f"✅ Synchronisé ({write_queue.flushed} cellule(s) envoyée(s))")
+            if n_pending and c_flush.button("⏫ Envoyer"):
+                write_queue.flush()
+                st.rerun()
+
         # --- ESPACE DE TRAVAIL ---
         if st.session_state.current_rid:
-            current_row_mask = df_base['rid'].astype(str) == str(st.session_state.current_rid)
+            current_row_mask = df_base['rid'] == str(st.session_state.current_rid)
             if current_row_mask.any():
                 current_row = df_base[current_row_mask].iloc[0]
 
@@ -284,75 +482,75 @@ with tab_cockpit:
                     card_count = 0
 
                     if sh_obj:
-                        df_c, _ = load_cards_data(sh_obj)
-                        if not df_c.empty:
-                            saved_cards = df_c[df_c['rid'].astype(str) == str(current_row['rid'])]
-                            if not saved_cards.empty:
-                                card_count += len(saved_cards)
-                                existing_context_text += "--- SAVED CARDS ---\n"
-                                for _, r in saved_cards.iterrows():
-                                    existing_context_text += f"Q: {r['question']} | A: {r['answer']}\n"
+                        load_cards_data(sh_obj)
+                        with perf.timer("cards.context"):
+                            saved_text, n_saved = saved_cards_context(get_card_cache(), current_row['rid'])
+                        card_count += n_saved
+                        existing_context_text += saved_text
 
                     if st.session_state.draft_cards:
                         card_count += len(st.session_state.draft_cards)
-                        existing_context_text += "--- DRAFT CARDS ---\n"
-                        for r in st.session_state.draft_cards:
-                            existing_context_text += f"Q: {r['question']} | A: {r['answer']}\n"
+                        existing_context_text += "--- DRAFT CARDS ---\n" + cards_context(st.session_state.draft_cards)
 
                     if card_count > 0:
                         st.info(f"ℹ️ {card_count} cartes en mémoire.")
 
                     # Formulaire
                     with st.form("ai_form"):
-                        mode = st.radio("Format", ["Cloze (Trous)", "Basic"], horizontal=True)
+                        mode = st.radio("Format", MODES, horizontal=True)
                         custom_inst = st.text_input("Instruction")
+                        bypass_cache = st.checkbox("Forcer une nouvelle génération (ignorer le cache)")
                         label_btn = "✨ Générer" if card_count == 0 else "➕ Ajouter Complémentaires"
                         submitted_gen = st.form_submit_button(label_btn, type="primary")
 
                     if submitted_gen:
                         if not st.session_state.api_key:
                             st.error("Manque clé API.")
+                        elif not st.session_state.selected_model:
+                            st.error("Aucun modèle Gemini sélectionné : rafraîchis la liste des modèles.")
                         else:
                             try:
-                                genai.configure(api_key=st.session_state.api_key)
-                                model = genai.GenerativeModel(st.session_state.selected_model)
-
-                                sys_prompt = """
-                                System Prompt: Radiology Anki Architect v3.1
-                                Role: Create Anki cards.
-                                CONTEXT AWARENESS: Check 'EXISTING CARDS'. Avoid duplicates. Find new angles.
-                                FORMAT CLOZE: {{c1::Pathology}} shows {{c2::sign}}. COL 2 (Answer) MUST BE EMPTY.
-                                FORMAT BASIC: Classic Q&A.
-                                OUTPUT: Column1|Column2|Column3
-                                """
-
-                                full_prompt = f"{sys_prompt}\n\nEXISTING CARDS:\n{existing_context_text}\n\nArticle: {current_row['title']}\nFormat: {mode}\nInstr: {custom_inst}\nText:\n{current_row['content']}"
-
-                                with st.spinner("Réflexion..."):
-                                    resp = model.generate_content(full_prompt)
-                                    clean = resp.text.replace("```", "").strip()
-                                    new_batch = []
-                                    for l in clean.split('\n'):
-                                        if '|' in l:
-                                            p = l.split('|')
-                                            if len(p) >= 2:
-                                                q = p[0].strip()
-                                                a = p[1].strip()
-                                                t = p[2].strip() if len(p) > 2 else ""
-                                                if len(q) > 5 and "Question" not in q:
-                                                    new_batch.append({
-                                                        "rid": str(current_row['rid']),
-                                                        "article_title": current_row['title'],
-                                                        "system": current_row['system'],
-                                                        "card_type": "Cloze" if "{{" in q else "Basic",
-                                                        "question": q, "answer": a, "tags": t
-                                                    })
-
-                                    if new_batch:
-                                        st.session_state.draft_cards.extend(new_batch)
-                                        st.rerun()
-                                    else:
-                                        st.warning("Rien de nouveau généré.")
+                                model = perf.wrap(get_gemini_model(st.session_state.api_key,
+                                                                   st.session_state.selected_model), "gemini")
+
+                                # Prompts déjà préparés par le préchargement si le contexte n'a pas changé
+                                pre = prefetcher.result(current_row['rid'], prefetch_key) if prefetcher else None
+                                if pre and pre['content'] and pre['context'] == existing_context_text \
+                                        and mode == MODES[0] and not custom_inst:
+                                    article_content, prompts = pre['content'], pre['prompts']
+                                else:
+                                    article_content = get_article_store().get_content(current_row['rid'], worksheet)
+                                    prompts = build_prompts(existing_context_text, current_row['title'], mode,
+                                                            custom_inst, article_content)
+
+                                key = cache_key(st.session_state.selected_model, mode, custom_inst, article_content,
+                                                existing_context_text)
+
+                                # Streaming : chaque carte s'affiche dès que sa ligne est complète
+                                live_draft = st.empty()
+                                new_batch, from_cache = [], False
+                                started = time.perf_counter()
+                                with st.spinner("Réflexion..." if len(prompts) == 1 else f"Réflexion ({len(prompts)} parties)..."), \
+                                        perf.timer("generation.stream", kind="latency", service="gemini"):
+                                    for cards, from_cache in stream_cards_cached(get_response_cache(), key, model,
+                                                                                 prompts, current_row, bypass_cache):
+                                        if not new_batch:
+                                            perf.record("latency", "gemini", "generation.first_card",
+                                                        time.perf_counter() - started)
+                                        new_batch.extend(cards)
+                                        live_draft.dataframe(
+                                            pd.DataFrame(st.session_state.draft_cards + new_batch)[['question', 'answer', 'tags']],
+                                            hide_index=True, use_container_width=True)
+
+                                if from_cache:
+                                    st.toast("Réponse servie depuis le cache", icon="⚡")
+
+                                if new_batch:
+                                    st.session_state.draft_cards.extend(new_batch)
+                                    st.rerun()
+                                else:
+                                    live_draft.empty()
+                                    st.warning("Rien de nouveau généré.")
                             except Exception as e:
                                 st.error(f"Erreur IA: {e}")
 
@@ -364,27 +562,41 @@ with tab_cockpit:
                         edited_draft = st.data_editor(draft_df[['question', 'answer', 'tags']], num_rows="dynamic",
                                                       key="draft_edit")
 
+                        # Quasi-doublons (deck existant + brouillon lui-même), avant validation
+                        with perf.timer("drafts.duplicates"):
+                            deck_index = get_card_cache().duplicates() if sh_obj else None
+                            dup_flags = flag_duplicates(deck_index,
+                                                        edited_draft['question'].fillna("").astype(str).tolist())
+                        if sh_obj and deck_index is None:
+                            st.caption("⏳ Index des quasi-doublons du deck en préparation : "
+                                       "seuls les doublons internes au brouillon sont signalés.")
+                        if dup_flags:
+                            st.warning("⚠️ Quasi-doublons détectés :\n" + "\n".join(
+                                f"- Ligne {i + 1} ≈ « {q[:100]} » ({sim:.0%})" for i, q, sim in dup_flags))
+
                         col_save, col_clear = st.columns(2)
                         if col_save.button("💾 Valider"):
                             try:
-                                final_rows_to_save = []
+                                _, ws_cards, cards_headers = load_cards_data(sh_obj)
+                                final_cards = []
                                 for idx, r in edited_draft.iterrows():
-                                    final_rows_to_save.append([
-                                        str(current_row['rid']), current_row['title'], current_row['system'],
-                                        "Cloze" if "{{" in r['question'] else "Basic",
-                                        r['question'], r['answer'], r['tags']
-                                    ])
-                                if final_rows_to_save:
-                                    _, ws_cards = load_cards_data(sh_obj)
-                                    ws_cards.append_rows(final_rows_to_save)
+                                    final_cards.append({
+                                        'rid': str(current_row['rid']), 'article_title': current_row['title'],
+                                        'system': current_row['system'],
+                                        'card_type': "Cloze" if "{{" in r['question'] else "Basic",
+                                        'question': r['question'], 'answer': r['answer'], 'tags': r['tags'],
+                                        ID_COL: new_card_id()
+                                    })
+                                if final_cards:
+                                    ws_cards.append_rows([card_row(c, cards_headers) for c in final_cards])
+                                    get_card_cache().append(final_cards)
 
                                     # Update statut
-                                    cell = worksheet.find(str(current_row['rid']))
-                                    headers = worksheet.row_values(1)
-                                    if 'flashcards_made' in headers:
-                                        worksheet.update_cell(cell.row, headers.index('flashcards_made') + 1, "Oui")
+                                    sheet_row = ws_index.row(current_row['rid'])
+                                    if sheet_row and ws_index.col('flashcards_made'):
+                                        write_queue.put(sheet_row, ws_index.col('flashcards_made'), "Oui")
                                         idx_local = \
-                                        df_base.index[df_base['rid'].astype(str) == str(current_row['rid'])].tolist()[0]
+                                        df_base.index[df_base['rid'] == str(current_row['rid'])].tolist()[0]
                                         st.session_state.df.at[idx_local, 'flashcards_made'] = True
 
                                     st.session_state.draft_cards = []
@@ -409,26 +621,27 @@ with tab_manager:
         "Filtrez, éditez ou supprimez vos cartes générées. Attention : les suppressions ici sont définitives sur le Google Sheet.")
 
     if sh_obj:
-        # Chargement frais des cartes
-        df_cards_all, ws_cards_all = load_cards_data(sh_obj)
+        # Chargement des cartes (cache partagé, rechargement forcé possible pour les éditions externes)
+        force_reload = st.button("🔄 Recharger depuis le Sheet")
+        df_cards_all, ws_cards_all, cards_headers = load_cards_data(sh_obj, force=force_reload)
 
         if not df_cards_all.empty:
             # --- FILTRES ---
             col_f1, col_f2, col_f3 = st.columns(3)
 
             # Filtre Système
-            u_sys_cards = sorted(list(set(df_cards_all['system'].astype(str).tolist())))
+            u_sys_cards = sorted(df_cards_all['system'].astype(str).unique())
             sel_sys_cards = col_f1.multiselect("Filtrer par Système", u_sys_cards)
 
             # Filtre Article (Titre)
-            u_title_cards = sorted(list(set(df_cards_all['article_title'].astype(str).tolist())))
+            u_title_cards = sorted(df_cards_all['article_title'].astype(str).unique())
             sel_title_cards = col_f2.multiselect("Filtrer par Article", u_title_cards)
 
             # Recherche Texte
             search_cards = col_f3.text_input("Recherche dans les questions", "")
 
             # Application des filtres
-            df_cards_view = df_cards_all.copy()
+            df_cards_view = df_cards_all
 
             if sel_sys_cards:
                 df_cards_view = df_cards_view[df_cards_view['system'].isin(sel_sys_cards)]
@@ -438,6 +651,7 @@ with tab_manager:
                 df_cards_view = df_cards_view[
                     df_cards_view['question'].str.contains(search_cards, case=False, na=False)]
 
+            df_cards_view = for_editor(df_cards_view)
             st.markdown(f"**{len(df_cards_view)}** cartes affichées (sur {len(df_cards_all)} au total).")
 
             # --- TABLEAU ÉDITABLE ---
@@ -448,6 +662,7 @@ with tab_manager:
                 use_container_width=True,
                 key="manager_editor",
                 column_config={
+                    ID_COL: None,
                     "rid": st.column_config.TextColumn("RID", disabled=True, width="small"),
                     "article_title": st.column_config.TextColumn("Article", disabled=True),
                     "system": st.column_config.TextColumn("Système", disabled=True, width="small"),
@@ -459,46 +674,68 @@ with tab_manager:
             )
 
             # --- BOUTON DE SAUVEGARDE ---
-            # La logique ici est délicate : comment réconcilier les edits avec le sheet ?
-            # Pour une app perso (< 5000 cartes), la méthode la plus sûre et simple est :
-            # 1. Si on détecte un changement, on demande confirmation.
-            # 2. On réécrit TOUT l'onglet Cards avec les nouvelles données (ceux filtrés + ceux non filtrés mais non touchés).
-            # Mais attention : si on filtre, on ne voit pas tout.
-
-            # Approche simplifiée robuste :
-            # On ne permet la sauvegarde que des modifications faites sur la VUE actuelle,
-            # mais il faut être sûr de ne pas écraser les autres.
-
+            # Sauvegarde différentielle par card_id : seules les lignes ajoutées / modifiées / supprimées
+            # de la vue (filtrée ou non) sont envoyées, les cartes masquées ne sont jamais touchées.
             if st.button("💾 Appliquer les modifications au Google Sheet", type="primary"):
                 try:
-                    # 1. Identifier les lignes modifiées/supprimées est complexe avec des filtres.
-                    # L'astuce : On recharge tout, on supprime les lignes qui correspondent à notre VUE actuelle (avant edit),
-                    # et on ajoute les lignes de notre VUE éditée.
-
-                    # Mais le plus simple pour éviter les bugs d'index :
-                    # Si l'utilisateur a filtré, il est risqué de réécrire.
-                    # On va utiliser une approche "Rewrite All" UNIQUEMENT si aucun filtre n'est actif,
-                    # OU on avertit l'utilisateur.
-
-                    if len(df_cards_view) != len(df_cards_all):
-                        st.warning(
-                            "⚠️ Attention : Vous utilisez des filtres. La modification directe en mode filtré est désactivée par sécurité pour éviter de perdre les cartes masquées. Veuillez effacer les filtres pour faire des modifications de masse.")
+                    with perf.timer("manager.diff"):
+                        inserted, updated, deleted = diff_cards(df_cards_view, edited_cards)
+                    if not (inserted or updated or deleted):
+                        st.info("Aucune modification à appliquer.")
                     else:
-                        # Pas de filtre actif, on peut réécrire l'onglet en toute sécurité
-                        # Convertir le DF édité en liste de listes
-                        # On garde l'ordre des colonnes du Sheet
-                        cols = ['rid', 'article_title', 'system', 'card_type', 'question', 'answer', 'tags']
-                        # Assurer que edited_cards a toutes les colonnes
-                        final_data = [cols] + edited_cards[cols].values.tolist()
-
-                        ws_cards_all.clear()
-                        ws_cards_all.update(final_data)
-
-                        st.success("Base de données mise à jour avec succès !")
+                        apply_card_diff(ws_cards_all, cards_headers, inserted, updated, deleted)
+                        get_card_cache().invalidate()
+                        st.success(
+                            f"Base de données mise à jour : {len(inserted)} ajout(s), {len(updated)} modification(s), {len(deleted)} suppression(s).")
                         time.sleep(1)
                         st.rerun()
 
                 except Exception as e:
                     st.error(f"Erreur lors de la sauvegarde : {e}")
+
+            # --- QUASI-DOUBLONS ---
+            with st.expander("🔁 Quasi-doublons du deck"):
+                if st.button("Analyser le deck"):
+                    with st.spinner("Indexation du deck..."):
+                        dup_index = get_card_cache().duplicates(wait=True)
+                    clusters = dup_index.clusters() if dup_index else []
+                    if clusters:
+                        by_id = df_cards_all.drop_duplicates(ID_COL).set_index(ID_COL)
+                        rows = [{"Groupe": n + 1, "Article": by_id.at[cid, 'article_title'],
+                                 "Question": by_id.at[cid, 'question']}
+                                for n, group in enumerate(clusters) for cid in group if cid in by_id.index]
+                        st.caption(f"{len(clusters)} groupe(s) de cartes similaires.")
+                        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+                    else:
+                        st.success("Aucun quasi-doublon détecté.")
         else:
-            st.info("Aucune carte trouvée dans l'onglet 'Cards'. Commencez par en générer dans le Cockpit !")
\ No newline at end of file
+            st.info("Aucune carte trouvée dans l'onglet 'Cards'. Commencez par en générer dans le Cockpit !")
+
+# ==========================================
+# 7. INSTRUMENTATION (fin du rerun)
+# ==========================================
+perf.finish()
+with st.sidebar.expander("⏱️ Performance"):
+    runs = perf.runs()
+    if runs:
+        last = runs[-1]
+        detail = pd.DataFrame(perf.breakdown(last))
+        st.caption(f"Dernier rerun : {last['seconds']:.2f} s")
+        if not detail.empty:
+            st.dataframe(detail[['service', 'name', 'calls', 'seconds', 'errors']], hide_index=True,
+                         use_container_width=True)
+
+        for service, (used, quota) in perf.quota_usage().items():
+            st.progress(min(used / quota, 1.0), text=f"{service} : {used}/{quota} appels / min")
+
+        history = pd.DataFrame([{
+            "rerun": r["rerun"], "total": r["seconds"],
+            "api": sum(e["seconds"] for e in r["events"] if e["kind"] == "api"),
+            "calcul": sum(e["seconds"] for e in r["events"] if e["kind"] == "compute"),
+        } for r in runs]).set_index("rerun")
+        st.line_chart(history, height=150)
+
+        c_json, c_csv = st.columns(2)
+        c_json.download_button("JSON", data=perf.to_json(), file_name=f"perf_{date.today()}.json",
+                               mime="application/json")
+        c_csv.download_button("CSV", data=perf.to_csv(), file_name=f"perf_{date.today()}.csv", mime="text/csv")
@@ -0,0 +1,41 @@
+from card_generation import CHARS_PER_TOKEN, _is_heading, chunk_article
+
+
+def sentences(n, word):
+    return " ".join(f"The {word} finding number {i} is seen on imaging." for i in range(n))
+
+
+def run_on(n, word):
+    # Paragraphe sans fin de phrase : coupé à la longueur maximale
+    return ", ".join(f"{word} sign {i}" for i in range(n))
+
+
+def make_article():
+    return "\n\n".join([
+        "# Imaging", sentences(35, "chest"),
+        "# Findings", run_on(300, "lung"),
+        "# Differential", "Short note.",
+        "# Treatment", sentences(30, "drain"),
+    ])
+
+
+def test_no_heading_only_chunk():
+    max_tokens = 500
+    chunks = chunk_article(make_article(), max_tokens)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        paragraphs = chunk.split("\n\n")
+        assert not all(_is_heading(p) for p in paragraphs), chunk
+        # Un titre n'est jamais le dernier paragraphe d'un morceau : il accompagne sa section
+        assert not _is_heading(paragraphs[-1])
+        assert len(chunk) <= max_tokens * CHARS_PER_TOKEN
+
+
+def test_chunks_keep_all_text():
+    content = make_article()
+    chunks = chunk_article(content, 500)
+    assert " ".join(" ".join(chunks).split()) == " ".join(content.split())
+
+
+def test_short_article_is_one_chunk():
+    assert chunk_article("# Title\n\nBody text.", 500) == ["# Title\n\nBody text."]
@@ -0,0 +1,128 @@
+import pandas as pd
+from gspread.exceptions import APIError
+
+from bench.fakes import ApiMeter, FakeSpreadsheet
+from card_store import ID_COL, apply_card_diff, diff_cards
+from schema import for_editor
+
+HEADERS = ['rid', 'article_title', 'system', 'card_type', 'question', 'answer', 'tags', ID_COL, 'review_note']
+
+
+def make_sheet():
+    rows = [HEADERS]
+    for i in range(6):
+        system = "Chest" if i % 2 == 0 else "Neuro"
+        rows.append([str(100 + i), f"Article {i}", system, "Basic", f"Question {i}?", f"Answer {i}", "", f"id{i}",
+                     f"note {i}"])
+    sh = FakeSpreadsheet(ApiMeter(), [("Cards", rows)])
+    return sh, sh.sheets[0]
+
+
+def snapshot(ws):
+    return pd.DataFrame(ws.rows[1:], columns=HEADERS)
+
+
+def by_id(ws):
+    return {r[HEADERS.index(ID_COL)]: r for r in ws.rows[1:]}
+
+
+def test_filtered_view_update_delete_insert():
+    sh, ws = make_sheet()
+    df_all = snapshot(ws)
+    view = for_editor(df_all[df_all['system'] == "Chest"])  # id0, id2, id4
+
+    # Modification hors de l'app après le chargement : colonnes non éditées dans la vue
+    ws.rows[1][HEADERS.index('tags')] = "external"
+    ws.rows[1][HEADERS.index('review_note')] = "edited in sheet"
+
+    edited = view.copy()
+    edited.loc[edited[ID_COL] == "id0", 'answer'] = "New answer"
+    edited = edited[edited[ID_COL] != "id2"]
+    edited = pd.concat([edited, pd.DataFrame([{'rid': "200", 'question': "Inserted question?"}])],
+                       ignore_index=True)
+
+    inserted, updated, deleted = diff_cards(view, edited)
+    assert updated == {"id0": {'answer': "New answer"}}
+    assert deleted == ["id2"]
+    assert len(inserted) == 1 and inserted[0]['question'] == "Inserted question?"
+
+    index = apply_card_diff(ws, HEADERS, inserted, updated, deleted)
+    rows = by_id(ws)
+
+    # Mise à jour : seule la cellule éditée change, les éditions externes survivent
+    assert rows["id0"][HEADERS.index('answer')] == "New answer"
+    assert rows["id0"][HEADERS.index('tags')] == "external"
+    assert rows["id0"][HEADERS.index('review_note')] == "edited in sheet"
+
+    # Suppression : uniquement la carte retirée de la vue ; les cartes masquées par le filtre restent intactes
+    assert "id2" not in rows
+    assert {"id1", "id3", "id4", "id5"} <= set(rows)
+    assert rows["id3"] == [str(103), "Article 3", "Neuro", "Basic", "Question 3?", "Answer 3", "", "id3", "note 3"]
+
+    # Ajout : une ligne en fin d'onglet avec un nouveau card_id
+    new_id = inserted[0][ID_COL]
+    assert ws.rows[-1][HEADERS.index(ID_COL)] == new_id
+    assert ws.rows[-1][HEADERS.index('question')] == "Inserted question?"
+    assert len(ws.rows) == 1 + 6 - 1 + 1
+
+    # L'index renvoyé reflète les positions réelles après suppression / ajout
+    for cid in rows:
+        assert ws.rows[index.row(cid) - 1][HEADERS.index(ID_COL)] == cid
+
+
+def test_no_changes_sends_nothing():
+    sh, ws = make_sheet()
+    view = snapshot(ws)
+    inserted, updated, deleted = diff_cards(view, view.copy())
+    assert (inserted, updated, deleted) == ([], {}, [])
+    assert apply_card_diff(ws, HEADERS, inserted, updated, deleted) is None
+    assert sh.meter.total() == 0
+
+
+def test_deletes_use_current_sheet_positions():
+    # Lignes insérées au-dessus depuis le chargement : les suppressions visent le bon card_id
+    sh, ws = make_sheet()
+    view = snapshot(ws)
+    ws.rows.insert(1, ["999", "Other", "Chest", "Basic", "Added elsewhere?", "", "", "idX", ""])
+    edited = view[view[ID_COL] != "id3"]
+    apply_card_diff(ws, HEADERS, *diff_cards(view, edited))
+    rows = by_id(ws)
+    assert "id3" not in rows and "idX" in rows and len(rows) == 6
+
+
+class _ServerError:
+    status_code = 503
+    text = "Backend error"
+
+    def json(self):
+        return {"error": {"code": 503, "message": "Backend error", "status": "UNAVAILABLE"}}
+
+
+def test_server_error_after_apply_does_not_delete_or_append_twice():
+    # Sheets applique le lot puis répond 503 : le nouvel essai repart de la colonne card_id relue
+    sh, ws = make_sheet()
+    view = snapshot(ws)
+    apply = sh.batch_update
+    calls = []
+
+    def flaky(body):
+        calls.append(body)
+        result = apply(body)
+        if len(calls) == 1:
+            raise APIError(_ServerError())
+        return result
+
+    sh.batch_update = flaky
+    edited = view[view[ID_COL] != "id1"].copy()
+    edited.loc[edited[ID_COL] == "id4", 'answer'] = "Changed"
+    edited = pd.concat([edited, pd.DataFrame([{'question': "Inserted question?"}])], ignore_index=True)
+    index = apply_card_diff(ws, HEADERS, *diff_cards(view, edited), backoff=0)
+
+    rows = by_id(ws)
+    assert set(rows) == {"id0", "id2", "id3", "id4", "id5", ws.rows[-1][HEADERS.index(ID_COL)]}
+    assert len(ws.rows) == 1 + 6
+    assert rows["id4"][HEADERS.index('answer')] == "Changed"
+    # Second lot : uniquement la mise à jour (idempotente), ni suppression ni ajout
+    assert [next(iter(r)) for r in calls[1]['requests']] == ['updateCells']
+    for cid in rows:
+        assert ws.rows[index.row(cid) - 1][HEADERS.index(ID_COL)] == cid
@@ -0,0 +1,39 @@
+from dedup import DuplicateIndex, flag_duplicates
+
+
+def make_index():
+    return DuplicateIndex.build(["a", "b", "c", "d"], [
+        "The {{c1::air crescent sign}} is typical of aspergilloma",
+        "Which sign is typical of a pneumothorax on a supine film?",
+        "",
+        "?!",
+    ])
+
+
+def test_blank_questions_are_not_indexed():
+    index = make_index()
+    assert set(index.sigs) == {"a", "b"}
+    assert index.query("") == [] and index.query(" ... ") == []
+
+
+def test_blank_drafts_are_never_flagged():
+    assert flag_duplicates(make_index(), ["", "?", "  ", "—"]) == []
+    assert flag_duplicates(None, ["", ""]) == []
+
+
+def test_near_duplicates_are_still_flagged():
+    flags = flag_duplicates(make_index(), [
+        "The {{c1::air-crescent sign}} is typical of aspergilloma.",
+        "Completely unrelated question about renal cysts",
+        "Completely unrelated question about renal cysts",
+    ])
+    assert [i for i, _, _ in flags] == [0, 2]
+    assert flags[0][1].startswith("The {{c1::air crescent sign}}")
+
+
+def test_rebuild_reuses_signatures_and_drops_removed_cards():
+    previous = make_index()
+    index = DuplicateIndex.build(["a", "e"], [previous.questions["a"], "A new question on hepatic adenoma"],
+                                 previous)
+    assert set(index.sigs) == {"a", "e"}
+    assert index.sigs["a"] is previous.sigs["a"]
@@ -0,0 +1,34 @@
+from article_store import ArticleStore
+from bench.fakes import ApiMeter, FakeSpreadsheet
+from schema import compact_articles
+from sheet_index import SheetIndex
+
+HEADERS = ['rid', 'title', 'system', 'content', 'remote_last_mod_date']
+# rid tels que saisis dans le Sheet : espaces et tabulations de bord
+ROWS = [HEADERS,
+        [" 101 ", "Pneumothorax", "Chest", "Deep sulcus sign on supine film", "2024-01-01"],
+        ["102\t", "Aspergilloma", "Chest", "Air crescent sign", "2024-01-02"],
+        ["103", "Lacunar infarct", "Neuro", "Small deep infarct", "2024-01-03"]]
+
+
+def test_index_answers_canonical_rids():
+    index = SheetIndex(HEADERS, [r[0] for r in ROWS[1:]])
+    assert [index.row(rid) for rid in ("101", "102", "103")] == [2, 3, 4]
+    assert index.row(" 102 ") == 3
+    index.delete_rows([2])
+    index.append(["  104"])
+    assert (index.row("101"), index.row("102"), index.row("104")) == (None, 2, 4)
+
+
+def test_store_uses_canonical_rids(tmp_path):
+    ws = FakeSpreadsheet(ApiMeter(), [("Articles", ROWS)]).sheets[0]
+    store = ArticleStore(str(tmp_path / "articles.sqlite"))
+    df = compact_articles(store.sync(ws))
+    index = SheetIndex(store.headers, df['rid'].tolist())
+    assert df['rid'].tolist() == ["101", "102", "103"]
+    assert index.row("102") == 3
+
+    store.sync_content(ws)
+    assert store.get_content("101") == "Deep sulcus sign on supine film"
+    assert store.search("crescent") == ["102"]
+    assert store.search("sign", rids=["101"]) == ["101"]
@@ -0,0 +1,63 @@
+import pytest
+from gspread.exceptions import APIError
+
+from bench.fakes import ApiMeter, FakeSpreadsheet
+from write_queue import WriteQueue
+
+
+class _Error:
+    def __init__(self, code):
+        self.status_code = code
+        self.text = f"error {code}"
+        self.code = code
+
+    def json(self):
+        return {"error": {"code": self.code, "message": self.text, "status": "ERROR"}}
+
+
+def make_queue(fail):
+    # fail(data) -> code d'erreur à lever pour ce lot, ou None pour l'appliquer
+    sh = FakeSpreadsheet(ApiMeter(), [("Articles", [["rid", "read_status"], ["1", ""], ["2", ""], ["3", ""]])])
+    ws = sh.sheets[0]
+    apply = ws.batch_update
+    batches = []
+
+    def batch_update(data, **kwargs):
+        batches.append([item['range'] for item in data])
+        code = fail(data)
+        if code:
+            raise APIError(_Error(code))
+        return apply(data, **kwargs)
+
+    ws.batch_update = batch_update
+    return WriteQueue(ws, max_pending=10 ** 6, flush_interval=3600, max_retries=0, backoff=0), ws, batches
+
+
+def test_invalid_cell_is_refused():
+    queue, _, _ = make_queue(lambda data: None)
+    with pytest.raises(ValueError):
+        queue.put(None, 2, "Oui")
+    with pytest.raises(ValueError):
+        queue.put(2, 0, "Oui")
+    assert queue.pending_count() == 0
+
+
+def test_permanent_error_isolates_bad_cell():
+    # 400 sur tout lot contenant B3 : les autres cellules partent, B3 est rejetée sans être renvoyée
+    queue, ws, _ = make_queue(lambda data: 400 if any(item['range'] == "B3" for item in data) else None)
+    for row in (2, 3, 4):
+        queue.put(row, 2, "Oui")
+    assert queue.flush() == 2
+    assert [r[1] for r in ws.rows[1:]] == ["Oui", "", "Oui"]
+    assert [(r, c, v) for r, c, v, _ in queue.failed] == [(3, 2, "Oui")]
+    assert queue.pending_count() == 0 and queue.last_error is None
+
+
+def test_transient_error_requeues_batch():
+    queue, ws, batches = make_queue(lambda data: 503)
+    queue.put(2, 2, "Oui")
+    queue.put(3, 2, "Oui")
+    assert queue.flush() == 0
+    assert len(batches) == 1  # pas de découpage sur une erreur passagère
+    assert queue.pending_count() == 2 and queue.failed == []
+    assert queue.last_error
@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+
+from gspread.exceptions import APIError
+from gspread.utils import ValueInputOption, rowcol_to_a1
+
+# ==========================================
+# FILE D'ÉCRITURE DIFFÉRÉE (write-behind)
+# ==========================================
+# Les éditions du tracker sont fusionnées par ligne/colonne (la dernière valeur
+# gagne) puis envoyées en un seul batch_update, soit après flush_interval
+# secondes, soit dès que max_pending cellules sont en attente.
+
+RETRY_STATUS = (429, 500, 502, 503)
+QUOTA_STATUS = (429,)  # seul code où l'on sait que la requête n'a pas été appliquée
+
+
+def with_backoff(fn, max_retries=5, backoff=1.0, retry_status=RETRY_STATUS):
+    # Réessaie fn() sur quota dépassé (429) / erreurs serveur, avec attente exponentielle.
+    # Écritures non idempotentes (suppression par position, ajout) : retry_status=QUOTA_STATUS,
+    # un 5xx pouvant arriver alors que Sheets a déjà appliqué la requête.
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except APIError as e:
+            if e.code not in retry_status or attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+
+def is_retryable(error):
+    # Quota / erreur serveur / réseau : l'envoi peut réussir plus tard. Le reste (400, 403...) est définitif.
+    if isinstance(error, APIError):
+        return error.code in RETRY_STATUS or error.code >= 500
+    return isinstance(error, OSError)
+
+
+def _valid_index(n):
+    return isinstance(n, int) and not isinstance(n, bool) and n >= 1
+
+
+class WriteQueue:
+    def __init__(self, worksheet, max_pending=20, flush_interval=3.0, max_retries=5, backoff=1.0):
+        self.worksheet = worksheet
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.cond = threading.Condition()
+        self.pending = {}  # {ligne: {colonne: valeur}}
+        self.first_pending_at = None
+        self.flushing = False
+        self.flushed = 0
+        self.last_error = None
+        self.failed = []  # [(ligne, colonne, valeur, erreur)] rejetées définitivement, jamais renvoyées
+        self.running = False
+
+    def put(self, row, col, value):
+        if not (_valid_index(row) and _valid_index(col)):
+            raise ValueError(f"Cellule invalide : ligne={row!r}, colonne={col!r}")
+        with self.cond:
+            self.pending.setdefault(row, {})[col] = value
+            if self.first_pending_at is None:
+                self.first_pending_at = time.time()
+            if not self.running:
+                self.running = True
+                threading.Thread(target=self._run, daemon=True).start()
+            self.cond.notify()
+
+    def pending_count(self):
+        with self.cond:
+            return sum(len(cols) for cols in self.pending.values())
+
+    def _due(self):
+        n = sum(len(cols) for cols in self.pending.values())
+        return n >= self.max_pending or (n > 0 and time.time() - self.first_pending_at >= self.flush_interval)
+
+    def _run(self):
+        # Le thread s'arrête dès que la file est vide ; put() le relance au besoin
+        while True:
+            with self.cond:
+                if not self.pending:
+                    self.running = False
+                    return
+                while self.pending and not self._due():
+                    self.cond.wait(max(0.0, self.first_pending_at + self.flush_interval - time.time()))
+                if not self.pending:
+                    continue
+            if not self.flush():
+                time.sleep(self.flush_interval)
+
+    def flush(self):
+        with self.cond:
+            if not self.pending or self.flushing:
+                return 0
+            batch, self.pending, self.first_pending_at = self.pending, {}, None
+            self.flushing = True
+
+        cells = [(r, c, v) for r, cols in batch.items() for c, v in cols.items()]
+        rejected = []
+        try:
+            sent = self._send(cells, rejected)
+        except Exception as e:
+            with self.cond:
+                # Erreur passagère : on remet les cellules en file sans écraser une édition plus récente
+                for r, cols in batch.items():
+                    current = self.pending.setdefault(r, {})
+                    for c, v in cols.items():
+                        current.setdefault(c, v)
+                if self.first_pending_at is None:
+                    self.first_pending_at = time.time()
+                self.last_error = str(e)
+                self.flushing = False
+            return 0
+
+        with self.cond:
+            self.flushed += sent
+            self.failed.extend(rejected)
+            self.last_error = None
+            self.flushing = False
+        return sent
+
+    def _send(self, cells, rejected):
+        # Erreur définitive sur un lot : on le coupe en deux pour isoler les cellules fautives
+        # (les autres partent quand même) ; une erreur passagère remonte pour remise en file.
+        try:
+            with_backoff(lambda: self.worksheet.batch_update(
+                [{'range': rowcol_to_a1(r, c), 'values': [[v]]} for r, c, v in cells],
+                value_input_option=ValueInputOption.user_entered,
+            ), self.max_retries, self.backoff)
+            return len(cells)
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            if len(cells) == 1:
+                rejected.append((*cells[0], str(e)))
+                return 0
+            half = len(cells) // 2
+            return self._send(cells[:half], rejected) + self._send(cells[half:], rejected)